@@ -0,0 +1,120 @@
+"""Choice analytics on a columnar view of the games/ snapshot.
+
+games_frame() normalises the nested games tree once into a long DataFrame with one row
+per submission (match_id, period, role, action, payoff, timestamp), with payoffs taken
+from the stored period results; every count and payoff figure is a vectorized group-by
+on that frame. FrameCache keeps the frame for the current snapshot so it is parsed at
+most once per process.
+"""
+import threading
+
+import pandas as pd
+
+from game_logic import DEFAULT_GAME, ROLES
+
+COLUMNS = ["match_id", "period", "role", "action", "timestamp", "payoff"]
+
+
+def _payoff_lookup(game):
+    rows, columns = game.actions[ROLES[0]], game.actions[ROLES[1]]
+    lookup = pd.MultiIndex.from_product([rows, columns], names=list(ROLES)).to_frame(index=False)
+    lookup[ROLES[0] + " payoff"] = game.table[..., 0].ravel()
+    lookup[ROLES[1] + " payoff"] = game.table[..., 1].ravel()
+    return lookup
+
+
+def _stored_payoff(node, period, role):
+    # Payoff from the materialised games/{match_id}/result/{period}, if written
+    result = ((node.get("result") or {}).get(period) or {}).get(role)
+    return result.get("payoff") if isinstance(result, dict) else None
+
+
+def _computed_payoffs(frame, game):
+    # Payoffs from the game table for submissions stored before results were materialised;
+    # a role that has not submitted anywhere yet is an all-NaN column, kept as object so it
+    # still merges with the lookup's action labels (and matches none of them)
+    outcomes = (frame.pivot(index=["match_id", "period"], columns="role", values="action")
+                .reindex(columns=list(ROLES))
+                .astype(object)
+                .reset_index()
+                .merge(_payoff_lookup(game), on=list(ROLES), how="left"))
+    payoffs = outcomes.melt(
+        id_vars=["match_id", "period"],
+        value_vars=[role + " payoff" for role in ROLES],
+        var_name="role", value_name="payoff"
+    )
+    payoffs["role"] = payoffs["role"].str.removesuffix(" payoff")
+    return frame.merge(payoffs, on=["match_id", "period", "role"], how="left")["payoff"].to_numpy()
+
+
+def games_frame(games, game=DEFAULT_GAME):
+    periods = set(game.period_names)
+    records = [
+        (match_id, period, role, submission.get("action"), submission.get("timestamp"),
+         _stored_payoff(node, period, role))
+        for match_id, node in (games or {}).items() if isinstance(node, dict)
+        for period, submissions in node.items() if period in periods and isinstance(submissions, dict)
+        for role, submission in submissions.items() if role in ROLES and isinstance(submission, dict)
+    ]
+    frame = pd.DataFrame.from_records(records, columns=COLUMNS)
+    frame["payoff"] = frame["payoff"].astype(float)
+    if frame.empty:
+        return frame
+
+    # Both submissions of a period and their result are written together, so a
+    # (match, period) is either fully stored or needs the lookup for both roles
+    missing = frame["payoff"].isna()
+    if missing.any():
+        frame.loc[missing, "payoff"] = _computed_payoffs(frame.loc[missing, COLUMNS[:-1]], game)
+    for column in ("period", "role", "action"):
+        frame[column] = frame[column].astype("category")
+    return frame[COLUMNS]
+
+
+def choice_counts(frame):
+    # Same shape as the stats/ counters: {period: {role: {action: count}}}
+    nested = {}
+    sizes = frame.groupby(["period", "role", "action"], observed=True).size()
+    for (period, role, action), count in sizes.items():
+        nested.setdefault(period, {}).setdefault(role, {})[action] = int(count)
+    return nested
+
+
+def payoff_summary(frame):
+    # Mean / total payoff per period and role over submissions whose partner also submitted
+    return (frame.dropna(subset=["payoff"])
+            .groupby(["period", "role"], observed=True)["payoff"]
+            .agg(["count", "mean", "sum"]))
+
+
+def match_results(frame, complete_only=True, game=DEFAULT_GAME):
+    # One row per match with both roles' action and payoff for every period
+    wide = frame.pivot(index="match_id", columns=["period", "role"], values=["action", "payoff"])
+    wide.columns = [f"{period} {role} {field}" for field, period, role in wide.columns]
+    wide = wide.reindex(columns=[f"{period} {role} {field}"
+                                 for period in game.period_names for role in ROLES
+                                 for field in ("action", "payoff")])
+    if complete_only:
+        periods_seen = frame.groupby("match_id", observed=True)["period"].nunique()
+        wide = wide[wide.index.isin(periods_seen[periods_seen == game.periods].index)]
+    return wide.sort_index()
+
+
+class FrameCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.token = None
+        self.frame = None
+        self.parses = 0
+
+    def get(self, games, token, game=DEFAULT_GAME):
+        # token identifies the snapshot (SnapshotCache fetch id); reparse only when it changes
+        token = (token, game.key)
+        with self.lock:
+            if self.frame is not None and token == self.token:
+                return self.frame
+        frame = games_frame(games, game)
+        with self.lock:
+            self.token, self.frame = token, frame
+            self.parses += 1
+        return frame
@@ -0,0 +1,264 @@
+"""Concurrent-player load test for the matching -> Period 1 -> Period 2 flow.
+
+Runs headless against the in-memory storage backend: every simulated participant is a
+thread that replays the reruns the Streamlit app performs for one session (the same
+reads through the shared snapshot cache, the same matchmaking transaction and
+submissions, the same waits). Streamlit's AppTest drives one session per script run,
+which is far too heavy for hundreds of participants, so the game logic is driven
+directly instead.
+
+    python benchmarks/bench_load.py --players 50 200 500 --latency 0.02
+
+Reports join-to-match latency, submission-to-outcome latency, storage reads and
+approximate bytes per player, and full reruns and waiting-fragment runs per player.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import game_logic  # noqa: E402
+from live_state import BACKOFF_MAX, BACKOFF_START, LIVE_WAIT_TIMEOUT, Backoff, LiveHub, SnapshotCache  # noqa: E402
+from storage import InstrumentedStorage, MemoryStorage  # noqa: E402
+
+WAIT_TICK = 1.0  # seconds between runs of a waiting fragment, as in streamlit_app.py
+
+class Server:
+    # What one Streamlit process shares between its sessions
+    def __init__(self, latency, wait_mode, pause_scale):
+        self.store = InstrumentedStorage(MemoryStorage(latency), keyed_roots=game_logic.KEYED_ROOTS)
+        self.hub = LiveHub(self.store)
+        self.cache = SnapshotCache(self.store, self.hub)
+        self.wait_mode = wait_mode
+        self.pause_scale = pause_scale
+
+    def pause(self, seconds):
+        time.sleep(seconds * self.pause_scale)
+
+
+class SimulatedPlayer:
+    def __init__(self, server, name, think_time, rng):
+        self.server = server
+        self.name = name
+        self.think_time = think_time
+        self.rng = rng
+        self.session = {}
+        self.reruns = 0
+        self.fragment_runs = 0
+        self.started = None
+        self.matched_at = None
+        self.submitted_at = {}
+        self.outcome_at = {}
+        self.error = None
+
+    def run(self):
+        try:
+            self.started = time.perf_counter()
+            while game_logic.PERIODS[-1] not in self.outcome_at:
+                self.reruns += 1
+                self.rerun()
+        except Exception as error:  # reported in the summary rather than killing the run
+            self.error = repr(error)
+
+    def mark_seen(self, *keys):
+        # Listener versions this rerun renders; none when waiting pages only poll
+        hub = self.server.hub
+        if self.server.wait_mode != "listen":
+            return {}
+        return {(path, child): hub.version(path, child) for path, child in keys if hub.watch(path)}
+
+    def wait_for_change(self, key, seen, check=None):
+        # The app's waiting fragment: every tick compares the marked versions in memory,
+        # consults storage (check) only when one moved or the backoff is due, and returns
+        # where the app would rerun the whole page. The backoff is kept per session and wait
+        # target across those reruns and starts over only when a marked version moved.
+        server = self.server
+        state = self.session.get("live_wait")
+        if state is None or state["key"] != key:
+            if check is not None or not seen:
+                backoff = Backoff(BACKOFF_START * server.pause_scale, BACKOFF_MAX * server.pause_scale)
+            else:
+                backoff = Backoff(LIVE_WAIT_TIMEOUT * server.pause_scale, LIVE_WAIT_TIMEOUT * server.pause_scale)
+            state = self.session["live_wait"] = {"key": key, "backoff": backoff, "seen": dict(seen)}
+        elif server.hub.moved(state["seen"]):
+            state["backoff"].reset()
+            state["seen"] = dict(seen)
+        backoff = state["backoff"]
+        seen = dict(seen)
+        while True:
+            server.pause(WAIT_TICK * self.rng.uniform(0.8, 1.2))
+            self.fragment_runs += 1
+            if not server.hub.moved(seen) and not backoff.due():
+                continue
+            backoff.idle()
+            if check is None or check():
+                return
+            seen.update({marked: server.hub.version(*marked) for marked in seen})
+
+    def rerun(self):
+        server, store, cache = self.server, self.server.store, self.server.cache
+        if (cache.get("expected_players") or 0) <= 0:
+            raise RuntimeError("expected_players not configured")
+        if not cache.get(f"players/{self.name}"):
+            game_logic.register_player(store, self.name)
+
+        if "match" not in self.session:
+            match_id, role = game_logic.lookup_player_match(store, self.name)
+            if not match_id:
+                cache.get("expected_players")
+                cache.get("stats")
+                match_id, role = game_logic.join_queue(store, self.name)
+                if not match_id:
+                    # The partner's join writes player_match/{name}; the waiting fragment
+                    # claims the match from the queue once that moves or the backoff is due
+                    def matched():
+                        nonlocal match_id, role
+                        match_id, role = game_logic.join_queue(store, self.name)
+                        return match_id is not None
+                    self.wait_for_change(("match", self.name), self.mark_seen(("player_match", self.name)), matched)
+            self.session["match"] = (match_id, role)
+            self.matched_at = time.perf_counter()
+        match_id, role = self.session["match"]
+
+        seen = self.mark_seen(("games", match_id))
+
+        outcomes, current_period = game_logic.DEFAULT_GAME.progress(cache.get(f"games/{match_id}"))
+        now = time.perf_counter()
+        for period, *_ in outcomes:
+            self.outcome_at.setdefault(period, now)
+        if current_period is None:
+            cache.get("expected_players")
+            cache.get("stats")
+            return
+        if ((cache.get(f"games/{match_id}") or {}).get(current_period) or {}).get(role):
+            self.wait_for_change(("period", match_id, current_period), seen)
+        else:
+            time.sleep(self.rng.uniform(0, self.think_time))
+            game_logic.record_submission(
+                store, match_id, current_period, role, self.rng.choice(game_logic.ACTIONS[role]), self.name
+            )
+            self.submitted_at[current_period] = time.perf_counter()
+            server.pause(1)
+
+
+def percentiles(values):
+    if not values:
+        return {"mean": None, "p50": None, "p95": None, "max": None}
+    ordered = sorted(values)
+    return {
+        "mean": statistics.fmean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1]
+    }
+
+
+def run_scenario(players, latency, wait_mode, pause_scale, think_time, arrival_window, seed):
+    server = Server(latency, wait_mode, pause_scale)
+    server.store.inner.set("expected_players", players)
+    server.store.reset()
+    rng = random.Random(seed)
+    simulated = [SimulatedPlayer(server, f"player{index:04d}", think_time, random.Random(rng.random()))
+                 for index in range(players)]
+
+    def arrive(player, delay):
+        time.sleep(delay)
+        player.run()
+
+    threads = [threading.Thread(target=arrive, args=(player, rng.uniform(0, arrival_window)))
+               for player in simulated]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    reads = server.store.totals({"get", "transaction"})
+    pushed = server.store.totals({"listen_event"})
+    writes = server.store.totals({"set", "update", "batch", "transaction", "delete"})
+    cache_counts = server.cache.counts()
+    return {
+        "players": players,
+        "wait_mode": wait_mode,
+        "latency": latency,
+        "elapsed_seconds": elapsed,
+        "errors": [player.error for player in simulated if player.error],
+        "join_to_match": percentiles([player.matched_at - player.started
+                                      for player in simulated if player.matched_at]),
+        "submission_to_outcome": {
+            period: percentiles([player.outcome_at[period] - player.submitted_at[period]
+                                 for player in simulated
+                                 if period in player.outcome_at and period in player.submitted_at])
+            for period in game_logic.PERIODS
+        },
+        "reads_per_player": reads["calls"] / players,
+        "read_bytes_per_player": (reads["bytes"] + pushed["bytes"]) / players,
+        "writes_per_player": writes["calls"] / players,
+        "reruns_per_player": statistics.fmean(player.reruns for player in simulated),
+        "fragment_runs_per_player": statistics.fmean(player.fragment_runs for player in simulated),
+        "cache": cache_counts
+    }
+
+
+def format_seconds(value):
+    return "-" if value is None else f"{value * 1000:8.1f} ms"
+
+
+def print_report(result):
+    print(f"\n=== {result['players']} players, wait={result['wait_mode']}, "
+          f"latency={result['latency'] * 1000:.0f} ms, took {result['elapsed_seconds']:.1f} s ===")
+    rows = [("join -> match", result["join_to_match"])]
+    rows += [(f"submit -> outcome ({period})", stats)
+             for period, stats in result["submission_to_outcome"].items()]
+    for label, stats in rows:
+        print(f"  {label:28s} mean {format_seconds(stats['mean'])}  p50 {format_seconds(stats['p50'])}  "
+              f"p95 {format_seconds(stats['p95'])}  max {format_seconds(stats['max'])}")
+    print(f"  reads/player {result['reads_per_player']:.1f}   "
+          f"bytes read/player {result['read_bytes_per_player']:.0f}   "
+          f"writes/player {result['writes_per_player']:.1f}   "
+          f"reruns/player {result['reruns_per_player']:.1f}   "
+          f"fragment runs/player {result['fragment_runs_per_player']:.1f}")
+    print(f"  snapshot cache: {result['cache']['hits']} hits / {result['cache']['misses']} misses")
+    if result["errors"]:
+        print(f"  ERRORS ({len(result['errors'])}): {result['errors'][:3]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--players", type=int, nargs="+", default=[50, 200, 500],
+                        help="cohort sizes to simulate (even numbers)")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="injected storage latency per call, in seconds")
+    parser.add_argument("--wait", choices=["listen", "poll"], default="listen",
+                        help="how waiting pages wake up: listener versions or backoff polling alone")
+    parser.add_argument("--pause-scale", type=float, default=0.1,
+                        help="multiplier for the app's sleeps, fragment ticks and backoff (1.0 = real time)")
+    parser.add_argument("--think-time", type=float, default=0.5,
+                        help="maximum random delay before a participant submits, in seconds")
+    parser.add_argument("--arrival-window", type=float, default=2.0,
+                        help="participants join uniformly over this many seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for players in args.players:
+        result = run_scenario(players, args.latency, args.wait, args.pause_scale,
+                              args.think_time, args.arrival_window, args.seed)
+        print_report(result)
+        results.append(result)
+    if args.json_path:
+        with open(args.json_path, "w") as handle:
+            json.dump(results, handle, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
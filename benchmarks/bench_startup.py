@@ -0,0 +1,94 @@
+"""Cold-start benchmark: time to first render of the player's join page.
+
+Every sample is a fresh Python process (nothing imported, no st.cache_resource
+singletons) that renders streamlit_app.py once with Streamlit's AppTest, against a
+SQLite store seeded with a configured session. It reports how long the first run
+took - imports of the app's modules included - and which heavy libraries that run
+pulled in; the join page should not need pandas, matplotlib, reportlab or pyarrow.
+numpy is listed too: game_logic needs it for the payoff table, so the join page does
+load it, and the report says so.
+
+    python benchmarks/bench_startup.py --samples 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HEAVY_MODULES = ("numpy", "pandas", "matplotlib", "reportlab", "pyarrow")
+
+# Runs in the child process; prints one JSON line
+SAMPLE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+started = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=60)
+app.run()
+print(json.dumps({
+    "first_render": time.perf_counter() - started,
+    "rendered_join_page": any("join the game" in widget.label for widget in app.text_input),
+    "errors": [str(error.value) for error in app.exception],
+    "heavy_modules": [name for name in sys.argv[2:] if name in sys.modules]
+}))
+"""
+
+
+def seed_store(sqlite_path, expected_players):
+    import sessions
+    from storage import create_storage
+
+    store = create_storage("sqlite", sqlite_path=sqlite_path)
+    session_id = sessions.ensure_active_session(store)
+    sessions.session_store(store, session_id).set("expected_players", expected_players)
+
+
+def run_sample(sqlite_path):
+    env = dict(os.environ, STORAGE_BACKEND="sqlite", SQLITE_PATH=sqlite_path)
+    output = subprocess.run(
+        [sys.executable, "-c", SAMPLE, os.path.join(ROOT, "streamlit_app.py"), *HEAVY_MODULES],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--samples", type=int, default=5, help="fresh processes to time")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        sqlite_path = os.path.join(workdir, "startup.sqlite3")
+        seed_store(sqlite_path, expected_players=2)
+        samples = [run_sample(sqlite_path) for _ in range(args.samples)]
+
+    timings = sorted(sample["first_render"] for sample in samples)
+    result = {
+        "samples": len(samples),
+        "first_render_mean": statistics.fmean(timings),
+        "first_render_p50": statistics.median(timings),
+        "first_render_max": timings[-1],
+        "rendered_join_page": all(sample["rendered_join_page"] for sample in samples),
+        "errors": sorted({error for sample in samples for error in sample["errors"]}),
+        "heavy_modules": sorted({name for sample in samples for name in sample["heavy_modules"]})
+    }
+    print(f"=== join page cold start, {result['samples']} fresh processes ===")
+    print(f"  first render  mean {result['first_render_mean'] * 1000:8.1f} ms  "
+          f"p50 {result['first_render_p50'] * 1000:8.1f} ms  max {result['first_render_max'] * 1000:8.1f} ms")
+    print(f"  heavy modules loaded: {', '.join(result['heavy_modules']) or 'none'}")
+    if not result["rendered_join_page"] or result["errors"]:
+        print(f"  ERRORS: join page rendered={result['rendered_join_page']} {result['errors'][:3]}")
+    if args.json_path:
+        with open(args.json_path, "w") as handle:
+            json.dump(result, handle, indent=2)
+    return result
+
+
+if __name__ == "__main__":
+    main()
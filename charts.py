@@ -0,0 +1,220 @@
+"""Percentage bar charts for the live views.
+
+Two rendering modes share one set of styles:
+
+- "matplotlib": drawn on standalone matplotlib Figure objects (never registered with
+  pyplot, so nothing accumulates in server memory) and kept as PNG bytes in a bounded
+  LRU cache keyed on (style, labels, counts, title, extras).
+- "vega": a Vega-Lite spec carrying only the counts, drawn by the browser.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+from metrics import Histogram
+
+# Server-side rendering only: preselect Agg so the lazy matplotlib import on the first
+# chart never probes for a GUI backend
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+CHART_CACHE_SIZE = 64
+CHART_MODES = ("matplotlib", "vega")
+
+# Look of the admin dashboard charts, the players' Game Summary charts and the PDF report
+CHART_STYLES = {
+    "admin": {
+        "figsize": (8, 5),
+        "figure_color": '#f8f9fa',
+        "axes_color": '#ffffff',
+        "colors": ['#e74c3c', '#3498db', '#2ecc71'],
+        "bar_width": 0.6,
+        "title_size": 14,
+        "title_pad": 15,
+        "label_size": 12,
+        "tick_size": 10,
+        "grid_alpha": 0.2,
+        "value_offset": 2,
+        "value_size": 10,
+        "sample_label": "n={total}",
+        "generated_at": "right"
+    },
+    "summary": {
+        "figsize": (10, 6),
+        "figure_color": '#f0f0f0',
+        "axes_color": '#e0e0e0',
+        "colors": ['#1f77b4', '#ff7f0e', '#2ca02c'],
+        "bar_width": 0.7,
+        "title_size": 16,
+        "title_pad": 20,
+        "label_size": 14,
+        "tick_size": 12,
+        "grid_alpha": 0.3,
+        "value_offset": 1,
+        "value_size": 12,
+        "sample_label": "Sample size: {total} participants",
+        "generated_at": "right"
+    },
+    # Charts embedded in the PDF report
+    "report": {
+        "figsize": (10, 6),
+        "figure_color": '#f0f0f0',
+        "axes_color": '#e0e0e0',
+        "colors": ['#1f77b4', '#ff7f0e', '#2ca02c'],
+        "bar_width": 0.5,
+        "title_size": 16,
+        "title_pad": 20,
+        "label_size": 14,
+        "tick_size": 10,
+        "grid_alpha": 0.3,
+        "value_offset": 1,
+        "value_size": 12,
+        "sample_label": None,
+        "generated_at": "left"
+    }
+}
+
+
+def render_percentage_bar(counts, labels, title, style, generated=None, dpi=200):
+    # counts maps label -> number of choices; returns PNG bytes
+    from matplotlib.figure import Figure
+
+    look = CHART_STYLES[style]
+    total = sum(counts.get(label, 0) for label in labels)
+    fig = Figure(figsize=look["figsize"])
+    try:
+        ax = fig.subplots()
+        if total == 0:
+            ax.text(0.5, 0.5, f'No data yet for {title}', ha='center', va='center',
+                    fontsize=12, transform=ax.transAxes)
+            ax.set_title(title, fontsize=look["title_size"], fontweight='bold')
+        else:
+            percentages = [counts.get(label, 0) / total * 100 for label in labels]
+            fig.patch.set_facecolor(look["figure_color"])
+            ax.set_facecolor(look["axes_color"])
+            ax.bar(labels, percentages, color=look["colors"][:len(labels)],
+                   linewidth=2, width=look["bar_width"])
+
+            ax.set_title(title, fontsize=look["title_size"], fontweight='bold', pad=look["title_pad"])
+            ax.set_ylabel("Percentage (%)", fontsize=look["label_size"])
+            ax.set_xlabel("Choice", fontsize=look["label_size"])
+            ax.tick_params(rotation=0, labelsize=look["tick_size"])
+            ax.set_ylim(0, max(100, max(percentages) * 1.1))
+            ax.grid(True, alpha=look["grid_alpha"], linestyle='-', linewidth=0.5)
+
+            # Add value labels
+            for bar in ax.patches:
+                height = bar.get_height()
+                ax.text(bar.get_x() + bar.get_width()/2., height + look["value_offset"],
+                        f'{height:.1f}%', ha='center', va='bottom',
+                        fontsize=look["value_size"], fontweight='bold')
+
+            # Add sample info
+            if style == "admin":
+                ax.text(0.02, 0.95, look["sample_label"].format(total=total), transform=ax.transAxes,
+                        fontsize=9, bbox=dict(boxstyle='round,pad=0.3', facecolor='lightgray', alpha=0.7))
+            elif look["sample_label"]:
+                ax.text(0.02, 0.98, look["sample_label"].format(total=total),
+                        transform=ax.transAxes, fontsize=10, verticalalignment='top', alpha=0.7,
+                        bbox=dict(boxstyle='round,pad=0.3', facecolor='white', alpha=0.8))
+            if generated:
+                x = 0.98 if look["generated_at"] == "right" else 0.02
+                ax.text(x, 0.98, f"Generated: {generated}", transform=ax.transAxes, fontsize=10,
+                        verticalalignment='top', horizontalalignment=look["generated_at"], alpha=0.7)
+            fig.tight_layout()
+
+        buffer = BytesIO()
+        fig.savefig(buffer, format="png", dpi=dpi, bbox_inches='tight')
+        return buffer.getvalue()
+    finally:
+        fig.clear()
+
+
+def percentage_bar_spec(counts, labels, title, style, generated=None):
+    # Vega-Lite version of render_percentage_bar: same colors, value labels and sample size
+    look = CHART_STYLES[style]
+    total = sum(counts.get(label, 0) for label in labels)
+    values = []
+    for label in labels:
+        percentage = counts.get(label, 0) / total * 100 if total else 0
+        values.append({
+            "choice": label,
+            "count": counts.get(label, 0),
+            "percentage": percentage,
+            "label": f"{percentage:.1f}%"
+        })
+
+    if total == 0:
+        subtitle = f"No data yet for {title}"
+    else:
+        subtitle = (look["sample_label"] or "").format(total=total)
+    if generated:
+        subtitle = " · ".join(filter(None, [subtitle, f"Generated: {generated}"]))
+
+    axis = {"labelFontSize": look["tick_size"], "titleFontSize": look["label_size"]}
+    top = max([100] + [value["percentage"] * 1.1 for value in values])
+    return {
+        "title": {"text": title, "subtitle": subtitle, "fontSize": look["title_size"],
+                  "fontWeight": "bold", "offset": look["title_pad"]},
+        "height": look["figsize"][1] * 60,
+        "data": {"values": values},
+        "encoding": {
+            "x": {"field": "choice", "type": "nominal", "sort": list(labels), "title": "Choice",
+                  "axis": {**axis, "labelAngle": 0}},
+            "y": {"field": "percentage", "type": "quantitative", "title": "Percentage (%)",
+                  "scale": {"domain": [0, top]},
+                  "axis": {**axis, "grid": True, "gridOpacity": look["grid_alpha"]}}
+        },
+        "layer": [
+            {
+                "mark": {"type": "bar", "width": {"band": look["bar_width"]}},
+                "encoding": {
+                    "color": {"field": "choice", "type": "nominal", "legend": None,
+                              "scale": {"domain": list(labels), "range": look["colors"][:len(labels)]}},
+                    "tooltip": [{"field": "choice", "title": "Choice"},
+                                {"field": "count", "title": "Count"},
+                                {"field": "label", "title": "Percentage"}]
+                }
+            },
+            {
+                "mark": {"type": "text", "baseline": "bottom", "dy": -look["value_offset"] * 2,
+                         "fontSize": look["value_size"], "fontWeight": "bold"},
+                "encoding": {"text": {"field": "label"}}
+            }
+        ],
+        "config": {"background": look["figure_color"], "view": {"fill": look["axes_color"]}}
+    }
+
+
+class ChartCache:
+    def __init__(self, maxsize=CHART_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.images = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.render_times = Histogram()
+
+    def render(self, counts, labels, title, style, generated=None):
+        key = (style, tuple(labels), tuple(counts.get(label, 0) for label in labels), title, generated)
+        with self.lock:
+            if key in self.images:
+                self.images.move_to_end(key)
+                self.hits += 1
+                return self.images[key]
+            self.misses += 1
+        started = time.perf_counter()
+        image = render_percentage_bar(counts, labels, title, style, generated)
+        with self.lock:
+            self.render_times.add(time.perf_counter() - started)
+            self.images[key] = image
+            self.images.move_to_end(key)
+            while len(self.images) > self.maxsize:
+                self.images.popitem(last=False)
+        return image
+
+    def counts(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.images),
+                    "render_times": self.render_times.to_dict()}
@@ -0,0 +1,295 @@
+"""Forward readers over the append-only events/ log.
+
+game_logic appends one event per registration, match creation and submission to
+events/{push id} in the same batch as the change itself. Push ids sort by creation
+time, so a reader only needs the last key it has seen: read_events() asks for the
+children after it with order_by_key().start_at(cursor), and what goes over the wire
+is proportional to new activity instead of to the size of the session.
+
+A key is made just before its batch commits, so under concurrency an event can land
+slightly after a later key is already visible. EventFeed therefore re-reads the last
+EVENT_SETTLE seconds of the log on every poll and drops what it already delivered;
+each event is handed out exactly once.
+
+Views kept up to date from those deltas, at O(1) per event:
+
+- ReactionTimes: the seconds from a period becoming playable (match created, or the
+  previous period finished) to each submission.
+- PlayerActivity: every player's status with precomputed counts per status and name
+  lists kept sorted as players move, so the admin monitor renders one page or filter
+  of players without touching the others.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter, deque
+
+import numpy as np
+
+from game_logic import DEFAULT_GAME, ROLES, period_label
+from storage import push_time
+
+EVENT_PAGE_SIZE = 500
+EVENT_SETTLE = 5  # seconds; events younger than this are re-read on the next poll
+RECENT_EVENTS = 20
+STUCK_AFTER = 120  # seconds in the same unfinished state before a player counts as stuck
+
+# PlayerActivity categories, in the order the monitor lists them
+ACTIVITY_CATEGORIES = {
+    "unmatched": "🔴 Waiting to be matched",
+    "playing": "🟡 Choosing",
+    "waiting": "⏳ Waiting for partner",
+    "completed": "🟢 Completed"
+}
+
+
+def read_events(store, cursor=None, limit=EVENT_PAGE_SIZE):
+    # Up to limit events after cursor, in log order, as [(key, event)]; start_at()
+    # includes the cursor key itself, which is skipped
+    page = store.get_page("events", start_at=cursor, limit=limit if cursor is None else limit + 1) or {}
+    return [(key, event) for key, event in page.items() if key != cursor]
+
+
+class EventFeed:
+    def __init__(self, store, cursor=None, page_size=EVENT_PAGE_SIZE, settle=EVENT_SETTLE):
+        self.store = store
+        self.cursor = cursor     # every event up to this key has been delivered and settled
+        self.page_size = page_size
+        self.settle = settle
+        self.unsettled = set()   # delivered keys after the cursor
+        self.lock = threading.Lock()
+
+    def poll(self, now=None):
+        # Every event not handed out before, in log order; advances the cursor
+        with self.lock:
+            fresh = []
+            position = self.cursor
+            while True:
+                page = read_events(self.store, position, self.page_size)
+                for key, event in page:
+                    if key not in self.unsettled:
+                        self.unsettled.add(key)
+                        fresh.append((key, event))
+                if len(page) < self.page_size:
+                    break
+                position = page[-1][0]
+            # Move the cursor over everything old enough not to be overtaken any more
+            horizon = (time.time() if now is None else now) - self.settle
+            for key in sorted(self.unsettled):
+                if push_time(key) >= horizon:
+                    break
+                self.cursor = key
+                self.unsettled.discard(key)
+            return fresh
+
+
+class ReactionTimes:
+    def __init__(self, game=DEFAULT_GAME):
+        self.game = game
+        self.lock = threading.Lock()
+        self.opened = {}     # (match_id, period) -> when the period became playable
+        self.submitted = {}  # (match_id, period) -> roles that have submitted
+        self.times = {period: {role: [] for role in ROLES} for period in game.period_names}
+        self.counts = Counter()
+        self.recent = deque(maxlen=RECENT_EVENTS)
+
+    def apply(self, events):
+        with self.lock:
+            for key, event in events:
+                kind = event.get("type")
+                self.counts[kind] += 1
+                self.recent.append(event)
+                if kind == "match":
+                    self.opened[(event["match_id"], self.game.period_names[0])] = event["timestamp"]
+                elif kind == "submission" and event.get("period") in self.times:
+                    self._submission(event)
+
+    def _submission(self, event):
+        match_id, period, role = event["match_id"], event["period"], event["role"]
+        opened = self.opened.get((match_id, period))
+        if opened is not None and role in ROLES:
+            self.times[period][role].append(event["timestamp"] - opened)
+        roles = self.submitted.setdefault((match_id, period), set())
+        roles.add(role)
+        if len(roles) == len(ROLES):
+            # Period finished: the next one opens now
+            del self.submitted[(match_id, period)]
+            self.opened.pop((match_id, period), None)
+            index = self.game.period_names.index(period)
+            if index + 1 < self.game.periods:
+                self.opened[(match_id, self.game.period_names[index + 1])] = event["timestamp"]
+
+    def summary(self):
+        # [{period, role, n, mean, median, p90}] in seconds
+        with self.lock:
+            rows = []
+            for period, by_role in self.times.items():
+                for role, times in by_role.items():
+                    if times:
+                        values = np.asarray(times)
+                        rows.append({"period": period, "role": role, "n": len(values),
+                                     "mean": float(values.mean()), "median": float(np.median(values)),
+                                     "p90": float(np.percentile(values, 90))})
+            return rows
+
+
+def _discard(ordered, item):
+    index = bisect_left(ordered, item)
+    if index < len(ordered) and ordered[index] == item:
+        del ordered[index]
+
+
+class PlayerActivity:
+    # Per-player status keyed by name. Applying an event touches at most the two players
+    # of one match; applying the same event twice changes nothing. "since" is the time of
+    # the player's last category change or submission, whichever came later. Besides the
+    # counts, every category keeps its names sorted, and unfinished players are kept in
+    # (since, name) order, so the stuck ones are a prefix found by bisection.
+    def __init__(self, game=DEFAULT_GAME):
+        self.game = game
+        self.lock = threading.Lock()
+        self.players = {}  # name -> {"match_id", "role", "done" (last finished period index), "category", "since"}
+        self.matches = {}  # match_id -> [Player 1 name, Player 2 name]
+        self.counts = Counter()
+        self.ordered = []  # every name, sorted
+        self.names = {category: [] for category in ACTIVITY_CATEGORIES}  # category -> sorted names
+        self.unfinished = []  # sorted (since, name) of players not completed
+        self.seeded = False
+
+    def _player(self, name, timestamp):
+        if name not in self.players:
+            self.players[name] = {"match_id": None, "role": None, "done": -1, "category": "unmatched",
+                                  "since": timestamp}
+            self.counts["unmatched"] += 1
+            insort(self.ordered, name)
+            insort(self.names["unmatched"], name)
+            insort(self.unfinished, (timestamp, name))
+        return self.players[name]
+
+    def _place(self, name, category, since):
+        # Moves a player to category as of since, keeping the counts and indexes in step
+        player = self.players[name]
+        if category != player["category"]:
+            self.counts[player["category"]] -= 1
+            self.counts[category] += 1
+            _discard(self.names[player["category"]], name)
+            insort(self.names[category], name)
+        if player["category"] != "completed":
+            _discard(self.unfinished, (player["since"], name))
+        if category != "completed":
+            insort(self.unfinished, (since, name))
+        player["category"], player["since"] = category, since
+
+    def _partner(self, player):
+        names = self.matches.get(player["match_id"]) or []
+        partner = names[1 - ROLES.index(player["role"])] if len(names) == len(ROLES) else None
+        return self.players.get(partner)
+
+    def _category(self, player):
+        if player["match_id"] is None:
+            return "unmatched"
+        if player["done"] == self.game.periods - 1:
+            return "completed"
+        partner = self._partner(player)
+        if partner is not None and partner["done"] < player["done"]:
+            return "waiting"
+        return "playing"
+
+    def _refresh(self, name, timestamp):
+        category = self._category(self.players[name])
+        if category != self.players[name]["category"]:
+            self._place(name, category, timestamp)
+
+    def _matched(self, match_id, names, timestamp):
+        self.matches[match_id] = list(names)
+        for name, role in zip(names, ROLES):
+            player = self._player(name, timestamp)
+            player["match_id"], player["role"] = match_id, role
+
+    def apply(self, events):
+        with self.lock:
+            for key, event in events:
+                kind, timestamp = event.get("type"), event.get("timestamp", 0)
+                if kind == "registration":
+                    self._player(event["player"], timestamp)
+                    continue
+                if kind == "match":
+                    self._matched(event["match_id"], event["players"], timestamp)
+                elif kind == "submission" and event.get("period") in self.game.period_names:
+                    player = self._player(event["player"], timestamp)
+                    player["match_id"], player["role"] = event["match_id"], event["role"]
+                    done = self.game.period_names.index(event["period"])
+                    if done > player["done"]:
+                        # A new period finished: the clock restarts even if the category stays
+                        player["done"] = done
+                        self._place(event["player"], player["category"], timestamp)
+                else:
+                    continue
+                for name in self.matches.get(event["match_id"]) or [event.get("player")]:
+                    if name in self.players:
+                        self._refresh(name, timestamp)
+
+    def seed(self, players, matches):
+        # Players and matches from before the event log existed, from one snapshot read
+        with self.lock:
+            self.seeded = True
+            for name, info in (players or {}).items():
+                info = info if isinstance(info, dict) else {}
+                player = self._player(name, info.get("timestamp", 0))
+                progress = info.get("progress")
+                if progress in self.game.period_names:
+                    player["done"] = max(player["done"], self.game.period_names.index(progress))
+            for match_id, match in (matches or {}).items():
+                names = (match or {}).get("players") or []
+                if len(names) == len(ROLES):
+                    self._matched(match_id, names, 0)
+            for name in self.players:
+                self._refresh(name, self.players[name]["since"])
+
+    def status(self, name):
+        # (status, activity) as the monitor shows them
+        player = self.players[name]
+        if player["category"] == "unmatched":
+            return "🔴 Registered", "Waiting to be matched"
+        if player["category"] == "completed":
+            return "🟢 Completed", "Game finished"
+        if player["done"] < 0:
+            return "🟡 Matched", f"Choosing in {period_label(self.game.period_names[0])}"
+        done = period_label(self.game.period_names[player["done"]])
+        if player["category"] == "waiting":
+            return f"🔵 {done} Done", "Waiting for partner"
+        return f"🔵 {done} Done", f"Choosing in {period_label(self.game.period_names[player['done'] + 1])}"
+
+    def stuck(self, name, now=None, after=STUCK_AFTER):
+        player = self.players[name]
+        return player["category"] != "completed" and (time.time() if now is None else now) - player["since"] > after
+
+    def _stuck_count(self, now=None, after=STUCK_AFTER):
+        # Unfinished players whose since is more than after seconds ago: a prefix of unfinished
+        horizon = (time.time() if now is None else now) - after
+        return bisect_left(self.unfinished, (horizon,))
+
+    def page(self, category=None, offset=0, limit=25, now=None, after=STUCK_AFTER):
+        # (total matching, rows of one page sorted by name); category is one of
+        # ACTIVITY_CATEGORIES, "stuck" or None for everyone
+        with self.lock:
+            if category == "stuck":
+                names = sorted(name for _, name in self.unfinished[:self._stuck_count(now, after)])
+                total = len(names)
+            elif category:
+                names, total = self.names[category], self.counts[category]
+            else:
+                names, total = self.ordered, len(self.ordered)
+            rows = []
+            for name in names[offset:offset + limit]:
+                status, activity = self.status(name)
+                rows.append({"player": name, "status": status, "activity": activity,
+                             "match_id": self.players[name]["match_id"], "since": self.players[name]["since"]})
+            return total, rows
+
+    def summary(self, now=None, after=STUCK_AFTER):
+        # Precomputed counts per category, plus the stuck count
+        with self.lock:
+            counts = {category: self.counts[category] for category in ACTIVITY_CATEGORIES}
+            counts["stuck"] = self._stuck_count(now, after)
+            return counts
@@ -0,0 +1,190 @@
+"""Streaming bulk export of the submissions to CSV, JSONL or Parquet.
+
+games/ is read in key-ordered pages (order_by_key().start_at().limit_to_first()) and
+each page is turned into tidy rows - one per submission - and written out before the
+next page is fetched, so memory stays bounded by the page size however big the
+session is. The players of each page come from one key-range query on matches/.
+
+    python export.py --format csv game_data.csv
+"""
+import argparse
+import csv
+import importlib.util
+import io
+import json
+import os
+import sys
+
+from game_logic import DEFAULT_GAME, ROLES
+
+# Parquet needs pyarrow (see requirements.txt); found without importing it, so the app's
+# first render stays light
+EXPORT_FORMATS = ("csv", "jsonl") + (("parquet",) if importlib.util.find_spec("pyarrow") else ())
+EXPORT_PAGE_SIZE = 500
+EXPORT_COLUMNS = ["match_id", "player_1", "player_2", "period", "role", "action", "payoff", "timestamp"]
+EXPORT_MIME_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+LEDGER_COLUMNS = ["player", "match_id", "match_payoff", "session_total"]
+
+
+def iter_game_pages(store, page_size=EXPORT_PAGE_SIZE):
+    # Yields (games page, matches for the same key range); the cursor key is re-read
+    # as the first child of the next page and skipped
+    cursor = None
+    while True:
+        limit = page_size if cursor is None else page_size + 1
+        page = store.get_page("games", start_at=cursor, limit=limit) or {}
+        fetched = len(page)
+        games = [(match_id, node) for match_id, node in page.items() if match_id != cursor]
+        if not games:
+            return
+        matches = store.get_page("matches", start_at=games[0][0], end_at=games[-1][0]) or {}
+        yield games, matches
+        if fetched < limit:
+            return
+        cursor = games[-1][0]
+
+
+def match_rows(match_id, node, match, game=DEFAULT_GAME):
+    players = list((match or {}).get("players") or [])
+    players += [None] * (len(ROLES) - len(players))
+    for period in game.period_names:
+        submissions = (node or {}).get(period) or {}
+        result = ((node or {}).get("result") or {}).get(period)
+        actions = [(submissions.get(role) or {}).get("action") for role in ROLES]
+        if result:
+            payoffs = [result[role]["payoff"] for role in ROLES]
+        else:
+            payoffs = game.payoff(*actions) if None not in actions else None
+        for index, role in enumerate(ROLES):
+            submission = submissions.get(role)
+            if not submission:
+                continue
+            yield {
+                "match_id": match_id,
+                "player_1": players[0],
+                "player_2": players[1],
+                "period": period,
+                "role": role,
+                "action": submission.get("action"),
+                "payoff": payoffs[index] if payoffs else None,
+                "timestamp": submission.get("timestamp")
+            }
+
+
+def iter_row_pages(store, page_size=EXPORT_PAGE_SIZE, game=DEFAULT_GAME):
+    for games, matches in iter_game_pages(store, page_size):
+        yield [row for match_id, node in games for row in match_rows(match_id, node, matches.get(match_id), game)]
+
+
+def _write_csv(pages, out):
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    writer = csv.DictWriter(text, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for rows in pages:
+        writer.writerows(rows)
+    text.flush()
+    text.detach()
+
+
+def _write_jsonl(pages, out):
+    for rows in pages:
+        out.write("".join(json.dumps(row) + "\n" for row in rows).encode("utf-8"))
+
+
+def _write_parquet(pages, out):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("match_id", pa.string()),
+        ("player_1", pa.string()),
+        ("player_2", pa.string()),
+        ("period", pa.string()),
+        ("role", pa.string()),
+        ("action", pa.string()),
+        ("payoff", pa.int64()),
+        ("timestamp", pa.float64())
+    ])
+    # One row group per page
+    with pq.ParquetWriter(out, schema) as writer:
+        for rows in pages:
+            if rows:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+
+
+def export_games(store, fmt, out, page_size=EXPORT_PAGE_SIZE, game=DEFAULT_GAME):
+    # out is a binary file object; returns the number of rows written
+    writers = {"csv": _write_csv, "jsonl": _write_jsonl, "parquet": _write_parquet}
+    if fmt not in writers:
+        raise ValueError(f"Unknown export format: {fmt!r}")
+    written = 0
+
+    def counted():
+        nonlocal written
+        for rows in iter_row_pages(store, page_size, game):
+            written += len(rows)
+            yield rows
+
+    writers[fmt](counted(), out)
+    return written
+
+
+def ledger_rows(ledger):
+    # One row per player and match from the ledger/ node (see game_logic.record_submission)
+    for player, entry in sorted((ledger or {}).items()):
+        for match_id, payoff in sorted(((entry or {}).get("matches") or {}).items()):
+            yield {"player": player, "match_id": match_id, "match_payoff": payoff,
+                   "session_total": entry.get("total", 0)}
+
+
+def export_ledger(store, out):
+    # Payoff ledger as CSV for paying participants; returns the number of rows written
+    rows = list(ledger_rows(store.get("ledger")))
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    writer = csv.DictWriter(text, fieldnames=LEDGER_COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+    text.flush()
+    text.detach()
+    return len(rows)
+
+
+def main(argv=None):
+    from game_logic import game_from_node
+    from sessions import session_store
+    from storage import create_storage
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("output", help="file to write")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--page-size", type=int, default=EXPORT_PAGE_SIZE)
+    parser.add_argument("--backend", default=os.environ.get("STORAGE_BACKEND", "firebase"),
+                        help="storage backend (firebase credentials come from FIREBASE_KEY / DATABASE_URL)")
+    parser.add_argument("--sqlite-path", default=os.environ.get("SQLITE_PATH"))
+    parser.add_argument("--session", help="session id to export (default: the active session)")
+    parser.add_argument("--ledger", action="store_true", help="write the payoff ledger (CSV) instead")
+    args = parser.parse_args(argv)
+
+    store = create_storage(
+        args.backend,
+        firebase_key=os.environ.get("FIREBASE_KEY"),
+        database_url=os.environ.get("DATABASE_URL"),
+        sqlite_path=args.sqlite_path
+    )
+    session_id = args.session or store.get("active_session")
+    if session_id:
+        store = session_store(store, session_id)
+    with open(args.output, "wb") as out:
+        if args.ledger:
+            written = export_ledger(store, out)
+        else:
+            written = export_games(store, args.format, out, args.page_size, game_from_node(store.get("game")))
+    print(f"Wrote {written} rows to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
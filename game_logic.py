@@ -0,0 +1,356 @@
+"""Game state operations shared by the Streamlit app and the benchmarks.
+
+Everything here takes a storage backend (see storage.py) and never touches Streamlit,
+so the matching and submission flow can be driven headless.
+"""
+import json
+import time
+
+import numpy as np
+
+ROLES = ("Player 1", "Player 2")
+# Roots whose children are keyed by match id or player name (for per-path metrics)
+KEYED_ROOTS = ("games", "matches", "players", "player_match", "ledger", "events")
+ACTIONS = {"Player 1": ["A", "B"], "Player 2": ["X", "Y", "Z"]}
+PAYOFF_MATRIX = {
+    "A": {"X": (4, 3), "Y": (0, 0), "Z": (1, 4)},
+    "B": {"X": (0, 0), "Y": (2, 1), "Z": (0, 0)}
+}
+
+
+# Action labels become path segments (stats/{period}/{role}/{action}): "/" would nest the
+# counter, Firebase rejects the rest, and all-digit keys read back as array indexes
+UNSAFE_KEY_CHARACTERS = set("/.$#[]")
+
+
+def check_action_labels(role, labels):
+    seen = set()
+    for label in labels:
+        if not label.strip():
+            raise ValueError(f"{role} has an empty action label")
+        if label in seen:
+            raise ValueError(f"{role} has the action {label!r} twice")
+        if UNSAFE_KEY_CHARACTERS & set(label) or not label.isprintable() or label.isdigit():
+            raise ValueError(f"{role} action {label!r} can't be a database key: avoid / . $ # [ ], "
+                             f"control characters and labels made only of digits")
+        seen.add(label)
+
+
+# A two-player game repeated for a number of periods: one action set per role and a
+# payoff table indexed [Player 1 action, Player 2 action] -> (Player 1, Player 2).
+# Stored per session under game/ as {"actions", "payoffs" (nested lists), "periods"}.
+class GameDefinition:
+    def __init__(self, actions, payoffs, periods=2):
+        self.actions = {role: [str(action) for action in actions[role]] for role in ROLES}
+        for role in ROLES:
+            check_action_labels(role, self.actions[role])
+        self.periods = int(periods)
+        if self.periods < 1:
+            raise ValueError("A game needs at least one period")
+        rows, columns = self.actions[ROLES[0]], self.actions[ROLES[1]]
+        if isinstance(payoffs, dict):
+            payoffs = [[payoffs[row][column] for column in columns] for row in rows]
+        self.table = np.asarray(payoffs, dtype=np.int64)
+        if self.table.shape != (len(rows), len(columns), 2):
+            raise ValueError(f"Payoff table must be {len(rows)} x {len(columns)} pairs, "
+                             f"got shape {self.table.shape}")
+        self.index = {role: {action: i for i, action in enumerate(self.actions[role])} for role in ROLES}
+        self.period_names = tuple(f"period{number}" for number in range(1, self.periods + 1))
+        self.key = json.dumps(self.to_dict(), sort_keys=True)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["actions"], data["payoffs"], data.get("periods", 2))
+
+    def to_dict(self):
+        return {"actions": self.actions, "payoffs": self.table.tolist(), "periods": self.periods}
+
+    def payoff(self, action1, action2):
+        pair = self.table[self.index[ROLES[0]][action1], self.index[ROLES[1]][action2]]
+        return int(pair[0]), int(pair[1])
+
+    def payoff_matrix(self):
+        return {row: {column: self.payoff(row, column) for column in self.actions[ROLES[1]]}
+                for row in self.actions[ROLES[0]]}
+
+    def result(self, action1, action2):
+        # Materialised outcome of one period, stored under games/{match_id}/result/{period}
+        payoffs = self.payoff(action1, action2)
+        return {role: {"action": action, "payoff": payoff}
+                for role, action, payoff in zip(ROLES, (action1, action2), payoffs)}
+
+    def period_actions(self, game, period):
+        # (Player 1 action, Player 2 action) of a finished period of games/{match_id}, else None
+        result = ((game or {}).get("result") or {}).get(period)
+        if result:
+            return tuple(result[role]["action"] for role in ROLES)
+        submissions = (game or {}).get(period) or {}
+        if all(role in submissions for role in ROLES):
+            return tuple(submissions[role]["action"] for role in ROLES)
+        return None
+
+    def progress(self, game):
+        # From one read of games/{match_id}: the finished periods in order as
+        # (period, action1, action2, payoffs) and the first unfinished period (None when done).
+        # Stored results are used as is; matches played before they existed are recomputed.
+        outcomes = []
+        results = (game or {}).get("result") or {}
+        for period in self.period_names:
+            result = results.get(period)
+            if result:
+                outcomes.append((period, result[ROLES[0]]["action"], result[ROLES[1]]["action"],
+                                 tuple(result[role]["payoff"] for role in ROLES)))
+                continue
+            submissions = (game or {}).get(period) or {}
+            if not all(role in submissions for role in ROLES):
+                return outcomes, period
+            action1, action2 = (submissions[role]["action"] for role in ROLES)
+            outcomes.append((period, action1, action2, self.payoff(action1, action2)))
+        return outcomes, None
+
+
+DEFAULT_GAME = GameDefinition(ACTIONS, PAYOFF_MATRIX, periods=2)
+PERIODS = DEFAULT_GAME.period_names
+
+
+def game_from_node(node):
+    return GameDefinition.from_dict(node) if node else DEFAULT_GAME
+
+
+def period_label(period):
+    return f"Period {period.removeprefix('period')}"
+
+
+# Append-only log of what happened, in the same batch as the change itself:
+# events/{push id} -> {"type": "registration" | "match" | "submission", "timestamp", ...}.
+# Push ids sort by time, so readers can follow it with a cursor (see events.py).
+def log_event(batch, kind, **fields):
+    return batch.push("events", {"type": kind, "timestamp": time.time(), **fields})
+
+
+# Aggregate counters under stats/ so readers never have to scan the whole games/ tree.
+# Layout: stats/{period}/{role}/{action} -> count, stats/completed_players -> count,
+# stats/registered_players -> count, stats/matches -> count
+# stats/joint, stats/payoffs and stats/transitions feed the transition analytics (see
+# transitions.py). Payoff ledger for paying participants, kept up to date as periods finish:
+# ledger/{name}/total -> session total, ledger/{name}/matches/{match_id} -> match total
+RECOUNT_AFTER = 10  # seconds before a submission whose counting batch never landed is counted again
+
+
+def record_submission(store, match_id, period, role, action, name, game=DEFAULT_GAME):
+    # The submission goes in through a transaction on the (small) match node, so exactly
+    # one of the two players sees the period complete and writes its result in the same
+    # commit. Counters, progress and the ledger follow in one batch, which also sets the
+    # submission's counted marker. If that batch fails, the player's page finds the
+    # marker still unset (uncounted_submissions) and calls this again, which re-runs the
+    # batch for the stored submission instead of losing it. Returns the period's result
+    # when this submission completed it.
+    submission = {"action": action, "timestamp": time.time(), "player": name, "counted": False}
+    outcome = {}
+
+    def submit(node):
+        node = dict(node or {})
+        outcome.clear()
+        submissions = dict(node.get(period) or {})
+        stored = submissions.get(role)
+        now = time.time()
+        if stored is not None:
+            # Submissions stored before the marker existed have no "counted" and were counted
+            if stored.get("counted", True) or now - stored.get("attempt", 0) < RECOUNT_AFTER:
+                return node  # counted, or its batch may still be in flight (e.g. a double click)
+            stored = dict(stored)
+        else:
+            stored = dict(submission)
+            if all(other in submissions for other in ROLES if other != role):
+                # This submission finishes the period: it also books the result
+                stored["finished_period"] = True
+        stored["attempt"] = now
+        submissions[role] = stored
+        node[period] = submissions
+        outcome["submission"] = stored
+        index = game.period_names.index(period)
+        if index:
+            outcome["previous"] = game.period_actions(node, game.period_names[index - 1])
+        if stored.get("finished_period"):
+            results = dict(node.get("result") or {})
+            results.setdefault(period, game.result(*(submissions[other]["action"] for other in ROLES)))
+            node["result"] = results
+            outcome["result"] = results[period]
+            outcome["players"] = [submissions[other].get("player") for other in ROLES]
+        return node
+
+    store.transaction(f"games/{match_id}", submit)
+    if not outcome:
+        return None
+    stored = outcome["submission"]
+    action, name = stored["action"], stored.get("player", name)
+    batch = store.batch("submission")
+    batch.set(f"games/{match_id}/{period}/{role}/counted", True)
+    log_event(batch, "submission", match_id=match_id, period=period, role=role, action=action,
+              player=name, timestamp=stored["timestamp"])
+    batch.increment(f"stats/{period}/{role}/{action}")
+    batch.set(f"players/{name}/progress", period)
+    if period == game.period_names[-1]:
+        batch.increment("stats/completed_players")
+    if outcome.get("previous"):
+        batch.increment(f"stats/transitions/{period}/{role}/{'/'.join(outcome['previous'])}/{action}")
+    if "result" in outcome:
+        result = outcome["result"]
+        batch.increment(f"stats/joint/{period}/{result[ROLES[0]]['action']}/{result[ROLES[1]]['action']}")
+        for other in ROLES:
+            batch.increment(f"stats/payoffs/{period}/{other}", result[other]["payoff"])
+        players = outcome["players"]
+        if None in players:
+            # The partner submitted before submissions carried the player's name
+            players = store.get(f"matches/{match_id}/players") or []
+        for player, other in zip(players, ROLES):
+            payoff = result[other]["payoff"]
+            batch.increment(f"ledger/{player}/total", payoff)
+            batch.increment(f"ledger/{player}/matches/{match_id}", payoff)
+    batch.commit()
+    return outcome.get("result")
+
+
+def uncounted_submissions(node, role, game=DEFAULT_GAME):
+    # [(period, submission)] of role in games/{match_id} whose counting batch has not landed
+    found = []
+    for period in game.period_names:
+        submission = ((node or {}).get(period) or {}).get(role)
+        if isinstance(submission, dict) and submission.get("counted") is False:
+            found.append((period, submission))
+    return found
+
+
+def recount_due(submission, now=None):
+    # True once record_submission() would count an uncounted submission again
+    return (time.time() if now is None else now) - submission.get("attempt", 0) >= RECOUNT_AFTER
+
+
+def register_player(store, name):
+    # Creates players/{name} at most once, so the registration counter stays exact
+    created = []
+
+    def claim(current):
+        created.clear()
+        if current:
+            return current
+        created.append(True)
+        return {"joined": True, "timestamp": time.time()}
+
+    store.transaction(f"players/{name}", claim)
+    if created:
+        batch = store.batch("registration").increment("stats/registered_players")
+        log_event(batch, "registration", player=name)
+        batch.commit()
+    return bool(created)
+
+
+def count_children(store, path):
+    # Shallow read: transfers {key: true} per child instead of every record
+    return len(store.get(path, shallow=True) or {})
+
+
+def stat_count(store, stats, counter, path):
+    # Maintained counter, or a shallow count of path for data written before it existed
+    if counter in stats:
+        return stats[counter]
+    return count_children(store, path)
+
+
+def choice_counts(stats, period, role, labels):
+    counts = (stats.get(period) or {}).get(role) or {}
+    return {label: counts.get(label, 0) for label in labels}
+
+
+# player_match/{name} -> {"match_id", "role"} so a player finds their match with one keyed read
+def create_match(store, pair):
+    match_id = f"{pair[0]}_vs_{pair[1]}"
+    batch = store.batch("match")
+    batch.set(f"matches/{match_id}", {"players": pair})
+    batch.set(f"player_match/{pair[0]}", {"match_id": match_id, "role": "Player 1"})
+    batch.set(f"player_match/{pair[1]}", {"match_id": match_id, "role": "Player 2"})
+    batch.increment("stats/matches")
+    log_event(batch, "match", match_id=match_id, players=list(pair))
+    batch.commit()
+    return match_id
+
+
+# Everything a session accumulates while playing; the game definition is kept
+GAME_DATA_ROOTS = ("games", "matches", "players", "stats", "player_match", "waiting_queue", "ledger",
+                   "events")
+
+
+def reset_game(store):
+    # All game data of the session in one atomic round trip
+    batch = store.batch("reset")
+    for root in GAME_DATA_ROOTS:
+        batch.delete(root)
+    batch.set("expected_players", 0)
+    return batch.commit()
+
+
+def lookup_player_match(store, name):
+    entry = store.get(f"player_match/{name}")
+    if entry:
+        return entry["match_id"], entry["role"]
+    return None, None
+
+
+# Matchmaking queue claimed through a transaction on waiting_queue/:
+#   waiting/{name} -> join timestamp
+#   claimed/{name} -> {"match_id", "role", "pair", "at", "creator"}
+# A joining player either pops the longest-waiting partner or enqueues itself; polling
+# again keeps the original join timestamp. Pairing claims both players, and the joining
+# player (the creator) then writes the match and its player_match/ entries with
+# create_match(). Until those exist a claimed player is never re-enqueued (or paired
+# twice): the creator retries create_match() on its next call if it failed, and the
+# partner's poll creates the match itself once the claim is CREATE_GRACE old without
+# one. Claims are otherwise left to expire: every transaction drops those older than
+# CLAIM_TTL; by then player_match/ has long been written, and join_queue() checks it first.
+CREATE_GRACE = 15  # seconds a partner leaves match creation to the creator
+CLAIM_TTL = 300  # seconds
+
+
+def join_queue(store, name):
+    match_id, role = lookup_player_match(store, name)
+    if match_id:
+        return match_id, role
+    outcome = {}
+
+    def claim(queue):
+        queue = queue or {}
+        now = time.time()
+        waiting = dict(queue.get("waiting") or {})
+        claimed = {player: entry for player, entry in (queue.get("claimed") or {}).items()
+                   if now - entry.get("at", now) < CLAIM_TTL}
+        outcome.clear()
+        if name in claimed:
+            # Claimed, but player_match/ is not written yet
+            entry = claimed[name]
+            if entry.get("creator") or now - entry["at"] >= CREATE_GRACE:
+                outcome.update(claimed.pop(name))
+        else:
+            joined = waiting.pop(name, None)
+            if waiting:
+                partner = min(waiting, key=waiting.get)
+                del waiting[partner]
+                pair = sorted([name, partner])
+                match_id = f"{pair[0]}_vs_{pair[1]}"
+                for player in pair:
+                    claimed[player] = {
+                        "match_id": match_id,
+                        "role": ROLES[pair.index(player)],
+                        "pair": pair,
+                        "at": now,
+                        "creator": player == name
+                    }
+                outcome.update(claimed[name])
+            else:
+                waiting[name] = joined or now
+        return {"waiting": waiting, "claimed": claimed}
+
+    store.transaction("waiting_queue", claim)
+    if "match_id" not in outcome:
+        return None, None
+    create_match(store, outcome["pair"])
+    return outcome["match_id"], outcome["role"]
@@ -0,0 +1,202 @@
+"""Process-wide live state shared by every session of the app.
+
+LiveHub turns storage listeners into per-child change versions that waiting pages can
+block on; SnapshotCache is a read-through cache that those versions keep exact.
+RerunReads is the per-rerun layer on top: one snapshot per node and rerun. Backoff
+spaces out the storage checks of a page that is waiting for somebody else.
+"""
+import random
+import threading
+import time
+
+LIVE_WAIT_TIMEOUT = 60  # seconds; safety rerun in case a stream silently drops
+SNAPSHOT_TTL = 2  # seconds
+BACKOFF_START = 2  # seconds before a waiting page first re-checks storage
+BACKOFF_MAX = 16  # seconds; longest gap between checks while nothing changes
+
+
+# One store.listen(path) stream per watched path bumps a version for the child that
+# changed, so waiting pages block on a condition instead of sleeping and re-reading.
+class LiveHub:
+    def __init__(self, store):
+        self.store = store
+        self.changed = threading.Condition()
+        self.listeners = {}
+        self.resets = {}          # path -> bumps when the whole node is replaced
+        self.child_versions = {}  # (path, child) -> bumps when that child changes
+
+    def watch(self, path):
+        with self.changed:
+            if path in self.listeners:
+                return True
+            self.listeners[path] = None
+        try:
+            self.listeners[path] = self.store.listen(
+                path, lambda event: self._on_event(path, event)
+            )
+        except Exception:
+            # Fall back to polling for this path; the next rerun tries again
+            with self.changed:
+                del self.listeners[path]
+            return False
+        return True
+
+    def _on_event(self, path, event):
+        segments = [part for part in (event.path or "/").split("/") if part]
+        if segments:
+            children = [segments[0]]
+        elif event.event_type == "patch" and isinstance(event.data, dict):
+            children = [key.split("/")[0] for key in event.data]
+        else:
+            children = None
+        with self.changed:
+            if children is None:
+                self.resets[path] = self.resets.get(path, 0) + 1
+            else:
+                for child in children:
+                    self.child_versions[(path, child)] = self.child_versions.get((path, child), 0) + 1
+                self.child_versions[(path, None)] = self.child_versions.get((path, None), 0) + 1
+            self.changed.notify_all()
+
+    def touch(self, path, child=None):
+        # Bump a version from inside the process (e.g. a background job finished)
+        with self.changed:
+            self.child_versions[(path, child)] = self.child_versions.get((path, child), 0) + 1
+            self.changed.notify_all()
+
+    def version_for(self, path):
+        # Version of the listened node covering path, or None when nothing listens to it
+        root, _, rest = path.strip("/").partition("/")
+        if self.listeners.get(root) is None:
+            return None
+        return self.version(root, rest.split("/")[0] or None)
+
+    def version(self, path, child=None):
+        return self.resets.get(path, 0) + self.child_versions.get((path, child), 0)
+
+    def moved(self, seen):
+        # seen maps (path, child or None) -> version; True once any of them moved
+        return any(self.version(*key) > version for key, version in seen.items())
+
+    def wait_for_change(self, seen, timeout=LIVE_WAIT_TIMEOUT):
+        with self.changed:
+            return self.changed.wait_for(lambda: self.moved(seen), timeout=timeout)
+
+
+# Entries for a path covered by a LiveHub listener stay valid until that listener
+# reports a change; anything else expires after ttl. Writes made through the store
+# invalidate immediately. Cached values are shared - treat them as read-only.
+class SnapshotCache:
+    def __init__(self, store, hub=None, ttl=SNAPSHOT_TTL):
+        self.store = store
+        self.hub = hub
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}   # path -> (fetched_at, listener version or None, value, fetch id)
+        self.fetching = {}  # path -> lock, so concurrent misses share one download
+        self.hits = 0
+        self.misses = 0
+        store.add_write_hook(lambda paths: self.invalidate(*paths))
+
+    def _version(self, path):
+        return self.hub.version_for(path) if self.hub is not None else None
+
+    def _fresh(self, entry, version, now):
+        if entry is None:
+            return False
+        fetched_at, entry_version = entry[0], entry[1]
+        if version is not None:
+            return entry_version == version and now - fetched_at < LIVE_WAIT_TIMEOUT
+        return now - fetched_at < self.ttl
+
+    def get(self, path):
+        return self.get_versioned(path)[0]
+
+    def get_versioned(self, path):
+        # (value, fetch id); the id changes only when the snapshot is downloaded again,
+        # so derived data can be memoized on it
+        with self.lock:
+            entry = self.entries.get(path)
+            if self._fresh(entry, self._version(path), time.monotonic()):
+                self.hits += 1
+                return entry[2], entry[3]
+            fetch_lock = self.fetching.setdefault(path, threading.Lock())
+        with fetch_lock:
+            # Another session may have fetched while we waited for the lock
+            version = self._version(path)
+            with self.lock:
+                entry = self.entries.get(path)
+                if self._fresh(entry, version, time.monotonic()):
+                    self.hits += 1
+                    return entry[2], entry[3]
+                self.misses += 1
+                fetch_id = self.misses
+            fetched_at = time.monotonic()
+            value = self.store.get(path)
+            with self.lock:
+                self.entries[path] = (fetched_at, version, value, fetch_id)
+            return value, fetch_id
+
+    def invalidate(self, *paths):
+        with self.lock:
+            for cached in list(self.entries):
+                for path in paths:
+                    path = path.strip("/")
+                    if not path or cached == path or cached.startswith(path + "/") \
+                    or path.startswith(cached + "/"):
+                        del self.entries[cached]
+                        break
+
+    def counts(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+
+# Lives for one script rerun. A node read once (e.g. games/{match_id}) answers every
+# later read of it or anything below it in the same rerun, so a rerun sees one
+# consistent snapshot and pays for it at most once.
+class RerunReads:
+    def __init__(self, cache):
+        self.cache = cache
+        self.values = {}
+
+    def get(self, path):
+        segments = [part for part in path.strip("/").split("/") if part]
+        for depth in range(len(segments), -1, -1):
+            ancestor = "/".join(segments[:depth])
+            if ancestor in self.values:
+                node = self.values[ancestor]
+                for part in segments[depth:]:
+                    node = node.get(part) if isinstance(node, dict) else None
+                return node
+        value = self.cache.get("/".join(segments))
+        self.values["/".join(segments)] = value
+        return value
+
+    def forget(self):
+        self.values.clear()
+
+
+# Exponential backoff with jitter for a waiting page: the first check is due after
+# start seconds and every idle check doubles the gap up to cap. Each gap is drawn
+# from [delay / 2, delay] so waiters that started together drift apart.
+class Backoff:
+    def __init__(self, start=BACKOFF_START, cap=BACKOFF_MAX):
+        self.start = start
+        self.cap = cap
+        self.reset()
+
+    def reset(self):
+        self.delay = self.start
+        self.due_at = time.monotonic() + self._jittered()
+
+    def _jittered(self):
+        return random.uniform(self.delay / 2, self.delay)
+
+    def due(self):
+        return time.monotonic() >= self.due_at
+
+    def idle(self):
+        # Nothing changed at this check - wait longer before the next one
+        self.delay = min(self.cap, self.delay * 2)
+        self.due_at = time.monotonic() + self._jittered()
@@ -0,0 +1,93 @@
+"""Lightweight in-process performance metrics for the admin "Performance" panel.
+
+Histogram keeps fixed latency buckets (no samples), so recording is O(1) and memory
+is constant; RerunTracker keeps a bounded log of script reruns.
+"""
+import threading
+import time
+from collections import deque
+
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+RERUN_LOG_SIZE = 5000
+
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        milliseconds = seconds * 1000
+        index = next((i for i, bound in enumerate(self.bounds) if milliseconds <= bound), len(self.bounds))
+        self.counts[index] += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def count(self):
+        return sum(self.counts)
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding that fraction of the samples (ms)
+        target = fraction * self.count()
+        running = 0
+        for bound, count in zip(self.bounds + (None,), self.counts):
+            running += count
+            if count and running >= target:
+                return bound if bound is not None else round(self.max * 1000, 1)
+        return None
+
+    def to_dict(self):
+        labels = [f"<={bound}ms" for bound in self.bounds] + [f">{self.bounds[-1]}ms"]
+        count = self.count()
+        return {
+            "count": count,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total * 1000 / count, 3) if count else None,
+            "max_ms": round(self.max * 1000, 3),
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "buckets": dict(zip(labels, self.counts))
+        }
+
+
+class RerunTracker:
+    # One entry per finished script rerun: session, page, storage calls / time / bytes
+    def __init__(self, maxlen=RERUN_LOG_SIZE):
+        self.lock = threading.Lock()
+        self.entries = deque(maxlen=maxlen)
+        self.storage_time = Histogram()  # time spent in storage calls per rerun
+
+    def record(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+            self.storage_time.add(entry["seconds"])
+
+    def recent(self, page=None):
+        with self.lock:
+            return [entry for entry in self.entries if page is None or entry["page"] == page]
+
+    def reruns_per_minute(self, window=300):
+        # session -> reruns per minute over the last window seconds
+        since = time.time() - window
+        per_session = {}
+        for entry in self.recent():
+            if entry["at"] >= since:
+                per_session[entry["session"]] = per_session.get(entry["session"], 0) + 1
+        return {session: count * 60 / window for session, count in per_session.items()}
+
+    def to_dict(self, window=300):
+        entries = self.recent()
+        with self.lock:
+            storage_time = self.storage_time.to_dict()
+        return {
+            "logged_reruns": len(entries),
+            "storage_time_per_rerun": storage_time,
+            "reruns_per_minute": self.reruns_per_minute(window),
+            "calls_per_rerun": {
+                page: sum(entry["calls"] for entry in entries if entry["page"] == page)
+                / max(1, sum(1 for entry in entries if entry["page"] == page))
+                for page in sorted({entry["page"] for entry in entries})
+            }
+        }
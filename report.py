@@ -0,0 +1,233 @@
+"""Comprehensive PDF report with all game data and graphs.
+
+build_report() only needs the analytics frame, so it can run on a worker thread away
+from the Streamlit script. Charts are rendered straight into memory (in parallel) and
+the finished PDF is returned as bytes. ReportJobs runs the builds in the background
+and keeps finished reports per data version, so repeated downloads are free.
+
+The summary, aggregates, charts and payoff matrix come first. In "full" mode the
+per-match results follow as chunked LongTables with a repeating header, so layout
+cost stays proportional to one chunk; "summary" mode leaves them out entirely.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+import analytics
+from charts import render_percentage_bar
+from game_logic import DEFAULT_GAME, ROLES, choice_counts, period_label
+
+REPORT_CHART_DPI = 300
+REPORT_CACHE_SIZE = 4
+REPORT_MODES = ("full", "summary")
+MATCH_TABLE_CHUNK = 250  # rows per LongTable in the match results appendix
+
+
+def match_table_header(game=DEFAULT_GAME):
+    header = ["Match ID"]
+    for period in game.period_names:
+        header += [period_label(period), f"{period_label(period)} Payoffs"]
+    return header
+
+
+def _outcome_columns(results, period):
+    # Vectorized version of the per-row "P1:A, P2:X" / "(4, 3)" cells
+    def action(role):
+        return results[f"{period} {role} action"].astype(object).where(
+            results[f"{period} {role} action"].notna(), "N/A").astype(str)
+
+    def payoff(role):
+        return results[f"{period} {role} payoff"].astype("Int64").astype(str)
+
+    actions = "P1:" + action("Player 1") + ", P2:" + action("Player 2")
+    complete = results[f"{period} Player 1 payoff"].notna() & results[f"{period} Player 2 payoff"].notna()
+    payoffs = ("(" + payoff("Player 1") + ", " + payoff("Player 2") + ")").where(complete, "N/A")
+    return actions, payoffs
+
+
+def match_table_rows(frame, game=DEFAULT_GAME):
+    # Yields the match results table body as plain string rows
+    results = analytics.match_results(frame, game=game)
+    if results.empty:
+        return
+    columns = [results.index.astype(str)]
+    for period in game.period_names:
+        columns.extend(_outcome_columns(results, period))
+    yield from zip(*columns)
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(list(row))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def render_report_charts(stats, chart_dpi=REPORT_CHART_DPI, workers=4, game=DEFAULT_GAME):
+    # PNG bytes for every period/role with data, rendered in parallel on separate Figures
+    today = datetime.today().strftime('%B %d, %Y')
+    jobs = []
+    for period in game.period_names:
+        for role in ROLES:
+            counts = choice_counts(stats, period, role, game.actions[role])
+            if sum(counts.values()) > 0:
+                jobs.append((counts, game.actions[role], f"{role} Choices ({period_label(period)})"))
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        return list(pool.map(
+            lambda job: render_percentage_bar(*job, "report", generated=today, dpi=chart_dpi), jobs
+        ))
+
+
+def build_report(frame, expected_players, chart_dpi=REPORT_CHART_DPI, mode="full",
+                 rows_per_table=MATCH_TABLE_CHUNK, game=DEFAULT_GAME):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    from reportlab.platypus import (SimpleDocTemplate, Paragraph, Spacer, Image, Table, LongTable,
+                                    TableStyle, PageBreak)
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+
+    if mode not in REPORT_MODES:
+        raise ValueError(f"Unknown report mode {mode!r}")
+
+    # Charts render while the rest of the story is assembled
+    chart_pool = ThreadPoolExecutor(max_workers=1)
+    charts_future = chart_pool.submit(render_report_charts, analytics.choice_counts(frame), chart_dpi,
+                                      game=game)
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    styles = getSampleStyleSheet()
+    story = []
+
+    # Title
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Title'],
+        fontSize=24,
+        textColor=colors.darkblue,
+        spaceAfter=30
+    )
+    story.append(Paragraph("🎲 Dynamic Game Complete Results", title_style))
+    story.append(Spacer(1, 20))
+
+    # Summary section
+    story.append(Paragraph("<b>Game Summary</b>", styles['Heading2']))
+    story.append(Paragraph(f"Expected Players: {expected_players}", styles['Normal']))
+    story.append(Paragraph(f"Total Matches: {frame['match_id'].nunique()}", styles['Normal']))
+    story.append(Spacer(1, 20))
+
+    # Aggregates
+    story.append(Paragraph("<b>Payoff Summary</b>", styles['Heading2']))
+    payoff_data = [["Period", "Role", "Outcomes", "Mean Payoff", "Total Payoff"]]
+    for (period, role), row in analytics.payoff_summary(frame).iterrows():
+        payoff_data.append([period, role, str(int(row["count"])), f"{row['mean']:.2f}", str(int(row["sum"]))])
+    summary_table = Table(payoff_data, colWidths=[1*inch, 1.2*inch, 1*inch, 1.2*inch, 1.2*inch])
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    story.append(summary_table)
+    story.append(Spacer(1, 30))
+
+    # Charts rendered in memory - no temporary files
+    story.append(Paragraph("<b>Statistical Analysis</b>", styles['Heading2']))
+    try:
+        chart_images = charts_future.result()
+    finally:
+        chart_pool.shutdown()
+    for image in chart_images:
+        story.append(Image(BytesIO(image), width=6*inch, height=4*inch))
+        story.append(Spacer(1, 20))
+
+    # Add payoff matrix reference
+    story.append(Paragraph("<b>Payoff Matrix Reference</b>", styles['Heading2']))
+    columns = game.actions[ROLES[1]]
+    payoff_data = [[""] + columns]
+    for action in game.actions[ROLES[0]]:
+        payoff_data.append([action] + [str(game.payoff(action, column)) for column in columns])
+    payoff_table = Table(payoff_data, colWidths=[1*inch] * len(payoff_data[0]))
+    payoff_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    story.append(payoff_table)
+    story.append(Spacer(1, 20))
+
+    story.append(Paragraph("Format: (Player 1 Payoff, Player 2 Payoff)", styles['Normal']))
+    story.append(Spacer(1, 20))
+
+    # Individual match results - chunked so each table lays out independently
+    if mode == "full":
+        story.append(PageBreak())
+        story.append(Paragraph("<b>Individual Match Results</b>", styles['Heading2']))
+        table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ])
+        # Match id column, then (actions, payoffs) per period sharing the remaining 5 inches
+        column_widths = [1.5*inch] + [3*inch / game.periods, 2*inch / game.periods] * game.periods
+        for chunk in _chunks(match_table_rows(frame, game), rows_per_table):
+            table = LongTable([match_table_header(game)] + chunk, repeatRows=1, colWidths=column_widths)
+            table.setStyle(table_style)
+            story.append(table)
+        story.append(Spacer(1, 20))
+    story.append(Paragraph("✅ Report generated automatically", styles['Normal']))
+
+    # Build PDF
+    doc.build(story)
+    return buffer.getvalue()
+
+
+class ReportJobs:
+    # One background worker; finished (or running) builds are kept per data version
+    def __init__(self, maxsize=REPORT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report")
+        self.jobs = OrderedDict()
+
+    def get(self, version):
+        with self.lock:
+            return self.jobs.get(version)
+
+    def submit(self, version, build, on_done=None):
+        with self.lock:
+            job = self.jobs.get(version)
+            if job is not None and not (job.done() and job.exception() is not None):
+                return job
+            job = self.executor.submit(build)
+            if on_done is not None:
+                job.add_done_callback(lambda _: on_done())
+            self.jobs[version] = job
+            self.jobs.move_to_end(version)
+            while len(self.jobs) > self.maxsize:
+                self.jobs.popitem(last=False)
+            return job
@@ -0,0 +1,108 @@
+"""Game sessions (cohorts) and their archival.
+
+Each classroom run lives under sessions/{session_id}/ with the same layout the app
+always used (players, matches, games, stats, player_match, waiting_queue,
+expected_players); active_session points at the one players join. The app reads
+through a ScopedStorage on the active session, so its working set never includes
+earlier cohorts.
+
+Finished sessions are archived in one multi-path update that writes a compact copy
+(gzip-compressed JSON) - either as a single leaf under archive/{session_id} or as a
+local file - removes the live subtree and moves the pointer to a fresh session.
+"""
+import base64
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+from game_logic import GAME_DATA_ROOTS
+from storage import ScopedStorage
+
+SESSION_ROOTS = GAME_DATA_ROOTS + ("expected_players",)
+
+
+def new_session_id():
+    return datetime.now().strftime("session-%Y%m%d-%H%M%S")
+
+
+def session_path(session_id):
+    return f"sessions/{session_id}"
+
+
+def session_store(store, session_id):
+    return ScopedStorage(store, session_path(session_id))
+
+
+def ensure_active_session(store):
+    # Returns the active session id, creating the first one on demand. State left at
+    # the root by earlier versions of the app is moved into that first session.
+    session_id = store.get("active_session")
+    if session_id:
+        return session_id
+    candidate = new_session_id()
+    session_id = store.transaction("active_session", lambda current: current or candidate)
+    if session_id != candidate:
+        return session_id
+    roots = store.get("/", shallow=True) or {}
+    batch = store.batch("migrate")
+    for root in SESSION_ROOTS:
+        if root in roots:
+            batch.set(f"{session_path(session_id)}/{root}", store.get(root))
+            batch.delete(root)
+    batch.commit()
+    return session_id
+
+
+def _pack(data):
+    return base64.b64encode(gzip.compress(json.dumps(data).encode("utf-8"))).decode("ascii")
+
+
+def _unpack(blob):
+    return json.loads(gzip.decompress(base64.b64decode(blob)).decode("utf-8"))
+
+
+def archive_session(store, session_id, archive_dir=None):
+    # Archives session_id and activates a new, empty session; returns the new id
+    data = store.get(session_path(session_id)) or {}
+    stats = data.get("stats") or {}
+    summary = {
+        "archived_at": time.time(),
+        "expected_players": data.get("expected_players") or 0,
+        "registered_players": stats.get("registered_players", 0),
+        "completed_players": stats.get("completed_players", 0)
+    }
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        filename = os.path.join(archive_dir, f"{session_id}.json.gz")
+        with gzip.open(filename, "wt", encoding="utf-8") as archive:
+            json.dump(data, archive)
+        summary["file"] = filename
+    else:
+        summary["data"] = _pack(data)
+
+    next_session = new_session_id()
+    if next_session == session_id:
+        next_session += "-2"
+    batch = store.batch("archive")
+    batch.set(f"archive/{session_id}", summary)
+    batch.delete(session_path(session_id))
+    batch.set("active_session", next_session)
+    batch.commit()
+    return next_session
+
+
+def list_archives(store):
+    # Archived session ids, without downloading their data
+    return sorted(store.get("archive", shallow=True) or {})
+
+
+def load_archive(store, session_id):
+    summary = store.get(f"archive/{session_id}")
+    if not summary:
+        return None
+    if "data" in summary:
+        return _unpack(summary["data"])
+    with gzip.open(summary["file"], "rt", encoding="utf-8") as archive:
+        return json.load(archive)
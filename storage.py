@@ -0,0 +1,679 @@
+"""Storage backends for the game state.
+
+Every backend exposes the same small interface (get, get_page, set, update,
+transaction, listen, delete) on slash-separated paths, following Realtime Database
+semantics:
+
+- FirebaseStorage wraps firebase_admin.db for the live deployment.
+- MemoryStorage keeps the tree in a dict (tests, benchmarks, quick local runs).
+- SQLiteStorage keeps it in a SQLite file for single-node deployments.
+
+ScopedStorage presents a subtree of any backend (one game session) as its own root.
+
+Writes that belong together go through store.batch(label): a WriteBatch collects
+them and commits them as one multi-location update() - a single atomic round trip
+whose duration is logged per label. push_id() makes chronologically ordered keys for
+append-only lists, so they can be part of a batch too.
+
+Every backend accepts ``latency`` (seconds added to each call) so local runs can
+mimic network round trips.
+"""
+import copy
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from metrics import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+
+def split_path(path):
+    return [part for part in (path or "").strip("/").split("/") if part]
+
+
+def join_path(*parts):
+    return "/".join(part.strip("/") for part in parts if part and part.strip("/"))
+
+
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+_push_lock = threading.Lock()
+_last_push = [0, [0] * 12]  # millisecond timestamp and random suffix of the last key
+
+
+def push_id(now=None):
+    # 20-character key ordered by creation time, made the way the Firebase client SDKs
+    # make push() keys: 8 characters of millisecond timestamp, then 12 random ones that
+    # are incremented rather than redrawn within the same millisecond
+    milliseconds = int((time.time() if now is None else now) * 1000)
+    with _push_lock:
+        if milliseconds == _last_push[0]:
+            suffix = _last_push[1]
+            for index in range(11, -1, -1):
+                suffix[index] = (suffix[index] + 1) % 64
+                if suffix[index]:
+                    break
+        else:
+            suffix = [random.randrange(64) for _ in range(12)]
+        _last_push[:] = [milliseconds, suffix]
+        suffix = list(suffix)
+    prefix = []
+    for _ in range(8):
+        milliseconds, digit = divmod(milliseconds, 64)
+        prefix.append(PUSH_CHARS[digit])
+    return "".join(reversed(prefix)) + "".join(PUSH_CHARS[digit] for digit in suffix)
+
+
+def push_time(key):
+    # Creation time (seconds) encoded in a push_id() key
+    milliseconds = 0
+    for char in key[:8]:
+        milliseconds = milliseconds * 64 + PUSH_CHARS.index(char)
+    return milliseconds / 1000
+
+
+class Event:
+    # Same shape as firebase_admin.db.Event: event_type is "put" or "patch", path is
+    # relative to the listened location and data is the new value there
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class WriteBatch:
+    # Collects writes as {path: value} and commits them with one update("/", ...);
+    # None deletes, like the database itself
+    def __init__(self, store, label):
+        self.store = store
+        self.label = label
+        self.updates = {}
+
+    def set(self, path, value):
+        self.updates[join_path(path)] = value
+        return self
+
+    def delete(self, path):
+        return self.set(path, None)
+
+    def increment(self, path, amount=1):
+        return self.set(path, {".sv": {"increment": amount}})
+
+    def push(self, path, value):
+        # Appends value under a new push_id() child of path; returns the key
+        key = push_id()
+        self.set(join_path(path, key), value)
+        return key
+
+    def commit(self):
+        # Returns the seconds the round trip took
+        if not self.updates:
+            return 0.0
+        return self.store.commit_batch(self.label, self.updates)
+
+
+class Storage:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._write_hooks = []
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add_write_hook(self, hook):
+        # hook(paths) runs after every write made through this backend (cache invalidation)
+        self._write_hooks.append(hook)
+
+    def _wrote(self, *paths):
+        for hook in self._write_hooks:
+            hook(paths)
+
+    def get(self, path, shallow=False):
+        raise NotImplementedError
+
+    def get_page(self, path, start_at=None, end_at=None, limit=None):
+        # Children of path in key order, like order_by_key().start_at().end_at().limit_to_first()
+        raise NotImplementedError
+
+    def set(self, path, value):
+        raise NotImplementedError
+
+    def update(self, path, values):
+        # Multi-location update: keys of values are paths relative to path
+        raise NotImplementedError
+
+    def transaction(self, path, update_fn):
+        # update_fn(current) -> new value; returns the committed value
+        raise NotImplementedError
+
+    def listen(self, path, callback):
+        # callback(Event) for the initial value and every change; returns an object with close()
+        raise NotImplementedError
+
+    def delete(self, path):
+        raise NotImplementedError
+
+    def batch(self, label):
+        return WriteBatch(self, label)
+
+    def commit_batch(self, label, updates):
+        started = time.perf_counter()
+        self.update("/", updates)
+        seconds = time.perf_counter() - started
+        logger.info("write batch %s: %d paths in %.1f ms", label, len(updates), seconds * 1000)
+        return seconds
+
+
+class FirebaseStorage(Storage):
+    def __init__(self, firebase_key, database_url, latency=0.0):
+        super().__init__(latency)
+        import firebase_admin
+        from firebase_admin import credentials, db
+
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(json.loads(firebase_key))
+            firebase_admin.initialize_app(cred, {
+                'databaseURL': database_url
+            })
+        self._db = db
+
+    def _ref(self, path):
+        return self._db.reference("/" + join_path(path))
+
+    def get(self, path, shallow=False):
+        self._delay()
+        return self._ref(path).get(shallow=shallow)
+
+    def get_page(self, path, start_at=None, end_at=None, limit=None):
+        self._delay()
+        query = self._ref(path).order_by_key()
+        if start_at is not None:
+            query = query.start_at(start_at)
+        if end_at is not None:
+            query = query.end_at(end_at)
+        if limit is not None:
+            query = query.limit_to_first(limit)
+        return query.get()
+
+    def set(self, path, value):
+        self._delay()
+        self._ref(path).set(value)
+        self._wrote(path)
+
+    def update(self, path, values):
+        self._delay()
+        self._ref(path).update(values)
+        self._wrote(*(join_path(path, key) for key in values))
+
+    def transaction(self, path, update_fn):
+        self._delay()
+        new_value = self._ref(path).transaction(update_fn)
+        self._wrote(path)
+        return new_value
+
+    def listen(self, path, callback):
+        return self._ref(path).listen(callback)
+
+    def delete(self, path):
+        self._delay()
+        self._ref(path).delete()
+        self._wrote(path)
+
+
+def _normalize(value):
+    # Drop nulls and empty containers the way the database does
+    if isinstance(value, dict):
+        pruned = {str(key): _normalize(child) for key, child in value.items()}
+        pruned = {key: child for key, child in pruned.items() if child is not None}
+        return pruned or None
+    if isinstance(value, list):
+        items = [_normalize(child) for child in value]
+        return items if any(child is not None for child in items) else None
+    return value
+
+
+def _replace(node, segments, value):
+    # Write value at segments below node (in place where possible) and return the new node
+    if not segments:
+        return value
+    if isinstance(node, list):
+        node = {str(index): child for index, child in enumerate(node) if child is not None}
+    if not isinstance(node, dict):
+        node = {}
+    head = segments[0]
+    child = _replace(node.get(head), segments[1:], value)
+    if child is None:
+        node.pop(head, None)
+    else:
+        node[head] = child
+    return node or None
+
+
+def key_order(key):
+    # Database key order: 32-bit integer keys numerically first, then strings
+    if key.lstrip("-").isdigit() and -2**31 <= int(key) < 2**31:
+        return 0, int(key), ""
+    return 1, 0, key
+
+
+class _Registration:
+    def __init__(self, storage, segments, callback):
+        self._storage = storage
+        self.segments = segments
+        self.callback = callback
+
+    def close(self):
+        with self._storage._lock:
+            if self in self._storage._listeners:
+                self._storage._listeners.remove(self)
+
+
+class LocalStorage(Storage):
+    # Shared logic for the in-process backends. Subclasses provide _read/_write on a
+    # list of path segments; every write batch runs under one lock so updates and
+    # transactions are atomic for all sessions in the process.
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self._lock = threading.RLock()
+        self._listeners = []
+
+    def _read(self, segments):
+        raise NotImplementedError
+
+    def _write(self, segments, value):
+        raise NotImplementedError
+
+    def _batch(self):
+        return nullcontext()
+
+    def _child_keys(self, segments):
+        node = self._read(segments)
+        if isinstance(node, list):
+            return [str(index) for index, child in enumerate(node) if child is not None]
+        return list(node) if isinstance(node, dict) else []
+
+    def _resolve(self, segments, value):
+        # Apply server values ({".sv": "timestamp"} and {".sv": {"increment": n}})
+        if isinstance(value, dict):
+            server_value = value.get(".sv")
+            if server_value is not None and len(value) == 1:
+                if server_value == "timestamp":
+                    return int(time.time() * 1000)
+                if isinstance(server_value, dict) and "increment" in server_value:
+                    current = self._read(segments)
+                    if isinstance(current, bool) or not isinstance(current, (int, float)):
+                        current = 0
+                    return current + server_value["increment"]
+                raise ValueError(f"Unsupported server value: {server_value!r}")
+            return {key: self._resolve(segments + [str(key)], child) for key, child in value.items()}
+        return value
+
+    def _commit(self, writes):
+        # Caller holds the lock. Returns listener notifications to deliver after release.
+        changed = []
+        with self._batch():
+            for path, value in writes.items():
+                segments = split_path(path)
+                value = _normalize(json.loads(json.dumps(self._resolve(segments, value))))
+                self._write(segments, value)
+                changed.append(segments)
+        notifications = []
+        for listener in self._listeners:
+            watched = listener.segments
+            for segments in changed:
+                if segments[:len(watched)] == watched:
+                    relative = "/" + "/".join(segments[len(watched):])
+                    notifications.append((listener, Event("put", relative, self._read(segments))))
+                elif watched[:len(segments)] == segments:
+                    notifications.append((listener, Event("put", "/", self._read(watched))))
+        return notifications
+
+    def _notify(self, notifications):
+        for listener, event in notifications:
+            listener.callback(event)
+
+    def _apply(self, writes):
+        with self._lock:
+            notifications = self._commit(writes)
+        self._notify(notifications)
+        self._wrote(*writes)
+
+    def get(self, path, shallow=False):
+        self._delay()
+        with self._lock:
+            value = self._read(split_path(path))
+        if shallow and isinstance(value, dict):
+            return {key: True if isinstance(child, (dict, list)) else child for key, child in value.items()}
+        return value
+
+    def get_page(self, path, start_at=None, end_at=None, limit=None):
+        self._delay()
+        segments = split_path(path)
+        with self._lock:
+            keys = sorted(self._child_keys(segments), key=key_order)
+            if start_at is not None:
+                keys = [key for key in keys if key_order(key) >= key_order(str(start_at))]
+            if end_at is not None:
+                keys = [key for key in keys if key_order(key) <= key_order(str(end_at))]
+            if limit is not None:
+                keys = keys[:limit]
+            return {key: self._read(segments + [key]) for key in keys}
+
+    def set(self, path, value):
+        self._delay()
+        self._apply({path: value})
+
+    def update(self, path, values):
+        if not values or not isinstance(values, dict):
+            raise ValueError('Value argument must be a non-empty dictionary.')
+        self._delay()
+        self._apply({join_path(path, key): value for key, value in values.items()})
+
+    def transaction(self, path, update_fn):
+        self._delay()
+        with self._lock:
+            new_value = update_fn(self._read(split_path(path)))
+            notifications = self._commit({path: new_value})
+        self._notify(notifications)
+        self._wrote(path)
+        return new_value
+
+    def listen(self, path, callback):
+        registration = _Registration(self, split_path(path), callback)
+        with self._lock:
+            self._listeners.append(registration)
+            initial = self._read(registration.segments)
+        callback(Event("put", "/", initial))
+        return registration
+
+    def delete(self, path):
+        self._delay()
+        self._apply({path: None})
+
+
+class MemoryStorage(LocalStorage):
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self._root = None
+
+    def _read(self, segments):
+        node = self._root
+        for part in segments:
+            if isinstance(node, dict):
+                node = node.get(part)
+            elif isinstance(node, list) and part.isdigit() and int(part) < len(node):
+                node = node[int(part)]
+            else:
+                return None
+        return copy.deepcopy(node)
+
+    def _write(self, segments, value):
+        self._root = _replace(self._root, segments, value)
+
+
+def _flatten(segments, value):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            yield from _flatten(segments + [key], child)
+    elif isinstance(value, list):
+        for index, child in enumerate(value):
+            if child is not None:
+                yield from _flatten(segments + [str(index)], child)
+    elif value is not None:
+        yield "/".join(segments), value
+
+
+def _arrays(node):
+    # Rebuild arrays from index-keyed children, like the database does on read
+    if not isinstance(node, dict):
+        return node
+    node = {key: _arrays(child) for key, child in node.items()}
+    if node and all(key.isdigit() for key in node):
+        indexes = [int(key) for key in node]
+        if max(indexes) < 2 * len(indexes):
+            return [node.get(str(index)) for index in range(max(indexes) + 1)]
+    return node
+
+
+class SQLiteStorage(LocalStorage):
+    # One row per leaf value, keyed by its full path
+    def __init__(self, filename, latency=0.0):
+        super().__init__(latency)
+        self._conn = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS nodes (path TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _subtree(self, prefix):
+        # Rows at prefix and below; "0" is the character right after "/"
+        if not prefix:
+            return "1 = 1", ()
+        return "path = ? OR (path > ? AND path < ?)", (prefix, prefix + "/", prefix + "0")
+
+    def _read(self, segments):
+        where, params = self._subtree("/".join(segments))
+        rows = self._conn.execute(f"SELECT path, value FROM nodes WHERE {where}", params).fetchall()
+        node = None
+        for path, value in rows:
+            node = _replace(node, split_path(path)[len(segments):], json.loads(value))
+        return _arrays(node)
+
+    def _child_keys(self, segments):
+        # Distinct first segment below the prefix, without loading the subtree's values
+        prefix = "/".join(segments)
+        where, params = self._subtree(prefix)
+        start = len(prefix) + 2 if prefix else 1
+        rows = self._conn.execute(
+            f"SELECT DISTINCT substr(path, ?, instr(substr(path, ?) || '/', '/') - 1) "
+            f"FROM nodes WHERE ({where}) AND path != ?",
+            (start, start, *params, prefix)
+        )
+        return [key for (key,) in rows]
+
+    def _write(self, segments, value):
+        where, params = self._subtree("/".join(segments))
+        self._conn.execute(f"DELETE FROM nodes WHERE {where}", params)
+        for depth in range(1, len(segments)):
+            # A leaf stored at an ancestor is replaced by the new subtree
+            self._conn.execute("DELETE FROM nodes WHERE path = ?", ("/".join(segments[:depth]),))
+        self._conn.executemany(
+            "INSERT INTO nodes (path, value) VALUES (?, ?)",
+            [(path, json.dumps(leaf)) for path, leaf in _flatten(segments, value)]
+        )
+
+    @contextmanager
+    def _batch(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+
+def _payload_bytes(value):
+    if value is None:
+        return 0
+    return len(json.dumps(value, default=str))
+
+
+class InstrumentedStorage(Storage):
+    # Wraps another backend and records, per (operation, path group), the number of
+    # calls, the time spent and the approximate JSON payload bytes moved. The second
+    # segment of keyed_roots (match ids, player names) is collapsed to "*", and so is
+    # the session id of sessions/{id}/... paths.
+    def __init__(self, inner, keyed_roots=()):
+        super().__init__(0.0)
+        self.inner = inner
+        self.keyed_roots = set(keyed_roots)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.metrics = {}
+
+    def path_group(self, path):
+        segments = split_path(path)
+        if not segments:
+            return "/"
+        offset = 0
+        if segments[0] == "sessions" and len(segments) > 1:
+            segments[1] = "*"
+            offset = 2
+        if len(segments) > offset + 1 and segments[offset] in self.keyed_roots:
+            segments[offset + 1] = "*"
+        return "/".join(segments)
+
+    def count_into(self, counter):
+        # Calls made from the current thread are also added to counter ({"calls",
+        # "seconds", "bytes"}) until another counter replaces it - one per rerun
+        self._local.counter = counter
+
+    def record(self, operation, path, seconds, payload):
+        key = (operation, self.path_group(path))
+        with self._lock:
+            entry = self.metrics.setdefault(
+                key, {"calls": 0, "seconds": 0.0, "bytes": 0, "latency": Histogram()}
+            )
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["bytes"] += payload
+            entry["latency"].add(seconds)
+        counter = getattr(self._local, "counter", None)
+        if counter is not None and operation != "listen_event":
+            counter["calls"] += 1
+            counter["seconds"] += seconds
+            counter["bytes"] += payload
+
+    def totals(self, operations=None):
+        with self._lock:
+            entries = [entry for (operation, _), entry in self.metrics.items()
+                       if operations is None or operation in operations]
+            return {
+                "calls": sum(entry["calls"] for entry in entries),
+                "seconds": sum(entry["seconds"] for entry in entries),
+                "bytes": sum(entry["bytes"] for entry in entries)
+            }
+
+    def snapshot(self):
+        # JSON-ready per (operation, path group) rows, busiest first
+        with self._lock:
+            rows = [{
+                "operation": operation,
+                "path": group,
+                "calls": entry["calls"],
+                "bytes": entry["bytes"],
+                "latency": entry["latency"].to_dict()
+            } for (operation, group), entry in self.metrics.items()]
+        return sorted(rows, key=lambda row: (-row["calls"], row["path"]))
+
+    def reset(self):
+        with self._lock:
+            self.metrics = {}
+
+    def add_write_hook(self, hook):
+        self.inner.add_write_hook(hook)
+
+    def _timed(self, operation, path, call, payload_of):
+        started = time.perf_counter()
+        result = call()
+        self.record(operation, path, time.perf_counter() - started, payload_of(result))
+        return result
+
+    def get(self, path, shallow=False):
+        return self._timed("get", path, lambda: self.inner.get(path, shallow=shallow), _payload_bytes)
+
+    def get_page(self, path, start_at=None, end_at=None, limit=None):
+        return self._timed("get", path, lambda: self.inner.get_page(path, start_at, end_at, limit),
+                           _payload_bytes)
+
+    def set(self, path, value):
+        self._timed("set", path, lambda: self.inner.set(path, value), lambda _: _payload_bytes(value))
+
+    def update(self, path, values):
+        self._timed("update", path, lambda: self.inner.update(path, values), lambda _: _payload_bytes(values))
+
+    def transaction(self, path, update_fn):
+        # Counts the committed value once for the read and once for the write
+        return self._timed("transaction", path, lambda: self.inner.transaction(path, update_fn),
+                           lambda result: 2 * _payload_bytes(result))
+
+    def listen(self, path, callback):
+        def counted(event):
+            self.record("listen_event", path, 0.0, _payload_bytes(event.data))
+            callback(event)
+        return self._timed("listen", path, lambda: self.inner.listen(path, counted), lambda _: 0)
+
+    def delete(self, path):
+        self._timed("delete", path, lambda: self.inner.delete(path), lambda _: 0)
+
+    def commit_batch(self, label, updates):
+        # Recorded under ("batch", label) instead of a generic update of "/"
+        started = time.perf_counter()
+        self.inner.update("/", updates)
+        seconds = time.perf_counter() - started
+        self.record("batch", label, seconds, _payload_bytes(updates))
+        logger.info("write batch %s: %d paths in %.1f ms", label, len(updates), seconds * 1000)
+        return seconds
+
+
+class ScopedStorage(Storage):
+    # View of inner below prefix: every path is relative to prefix, and write hooks
+    # only see writes that touch the prefix (translated back to relative paths)
+    def __init__(self, inner, prefix):
+        super().__init__(0.0)
+        self.inner = inner
+        self.prefix = join_path(prefix)
+        inner.add_write_hook(self._inner_wrote)
+
+    def _path(self, path):
+        return join_path(self.prefix, path)
+
+    def _inner_wrote(self, paths):
+        relative = []
+        for path in paths:
+            path = join_path(path)
+            if path == self.prefix or path.startswith(self.prefix + "/"):
+                relative.append(path[len(self.prefix) + 1:])
+            elif not path or self.prefix.startswith(path + "/"):
+                relative.append("")
+        if relative:
+            self._wrote(*relative)
+
+    def get(self, path, shallow=False):
+        return self.inner.get(self._path(path), shallow=shallow)
+
+    def get_page(self, path, start_at=None, end_at=None, limit=None):
+        return self.inner.get_page(self._path(path), start_at, end_at, limit)
+
+    def set(self, path, value):
+        self.inner.set(self._path(path), value)
+
+    def update(self, path, values):
+        self.inner.update(self._path(path), values)
+
+    def transaction(self, path, update_fn):
+        return self.inner.transaction(self._path(path), update_fn)
+
+    def listen(self, path, callback):
+        return self.inner.listen(self._path(path), callback)
+
+    def delete(self, path):
+        self.inner.delete(self._path(path))
+
+    def commit_batch(self, label, updates):
+        return self.inner.commit_batch(label, {self._path(path): value for path, value in updates.items()})
+
+
+def create_storage(backend, latency=0.0, **options):
+    if backend == "firebase":
+        return FirebaseStorage(options["firebase_key"], options["database_url"], latency)
+    if backend == "memory":
+        return MemoryStorage(latency)
+    if backend == "sqlite":
+        return SQLiteStorage(options.get("sqlite_path") or "game_state.sqlite3", latency)
+    raise ValueError(f"Unknown storage backend: {backend!r}")
@@ -1,287 +1,329 @@
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, db
+import io
 import json
+import logging
+import os
 import time
 import random
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from io import BytesIO
-import base64
-import matplotlib.pyplot as plt
-import pandas as pd
+import tempfile
+import uuid
 from datetime import datetime
 
 st.set_page_config(page_title="🎲 2-Period Dynamic Game")
-
-st.title("🎲 Multiplayer 2-Period Dynamic Game")
+logger = logging.getLogger(__name__)
+
+# pandas (analytics), matplotlib (charts) and reportlab (report) are imported only on
+# the paths that draw tables, charts or PDFs - a player joining or submitting never
+# pays for them. See benchmarks/bench_startup.py.
+import game_logic
+import sessions
+import transitions
+from game_logic import ROLES, choice_counts, period_label
+from charts import CHART_MODES, ChartCache, percentage_bar_spec
+from live_state import LIVE_WAIT_TIMEOUT, Backoff, LiveHub, RerunReads, SnapshotCache
+from metrics import RerunTracker
+from events import ACTIVITY_CATEGORIES, STUCK_AFTER, EventFeed, PlayerActivity, ReactionTimes
+from export import EXPORT_FORMATS, EXPORT_MIME_TYPES, export_games, export_ledger
+from storage import InstrumentedStorage, create_storage
+
+def setting(key, default=None):
+    # Streamlit secrets first, then environment variables (e.g. STORAGE_BACKEND=memory)
+    try:
+        if key in st.secrets:
+            return st.secrets[key]
+    except Exception:
+        pass
+    return os.environ.get(key.upper(), default)
+
+# Storage backend: Firebase RTDB by default; "memory" or "sqlite" run without a Firebase project.
+# Wrapped so every call is counted per path group and per rerun. The credentials are parsed
+# and the Firebase app initialised once per process, here - not on every rerun.
+@st.cache_resource
+def get_storage():
+    backend = setting("storage_backend", "firebase")
+    latency = float(setting("storage_latency", 0))
+    if backend == "firebase":
+        # Firebase credentials and config
+        backend_store = create_storage(
+            "firebase", latency,
+            firebase_key=setting("firebase_key"),
+            database_url=setting("database_url")
+        )
+    else:
+        backend_store = create_storage(backend, latency, sqlite_path=setting("sqlite_path"))
+    return InstrumentedStorage(backend_store, keyed_roots=game_logic.KEYED_ROOTS)
+
+root_store = get_storage()
+
+# Storage calls made by this rerun. A rerun can end anywhere (st.stop, st.rerun), so
+# the previous rerun's totals are logged at the next one (and shown to the admin).
+@st.cache_resource
+def rerun_tracker():
+    return RerunTracker()
+
+if "browser_session" not in st.session_state:
+    st.session_state["browser_session"] = uuid.uuid4().hex[:8]
+rerun_calls = {"calls": 0, "seconds": 0.0, "bytes": 0, "page": "player", "at": time.time(),
+               "session": st.session_state["browser_session"]}
+previous_rerun = st.session_state.get("rerun_calls")
+st.session_state["rerun_calls"] = rerun_calls
+root_store.count_into(rerun_calls)
+if previous_rerun:
+    rerun_tracker().record(previous_rerun)
+    logger.info("%s rerun of %s: %d storage calls in %.1f ms, %d bytes", previous_rerun["page"],
+                previous_rerun["session"], previous_rerun["calls"], previous_rerun["seconds"] * 1000,
+                previous_rerun["bytes"])
+
+# Game sessions: everything below lives under sessions/{SESSION_ID}/; the active_session
+# pointer is listened to, so switching sessions reaches every page on its next rerun
+@st.cache_resource
+def session_pointer():
+    hub = LiveHub(root_store)
+    return hub, SnapshotCache(root_store, hub)
+
+def active_session():
+    hub, cache = session_pointer()
+    hub.watch("active_session")
+    return cache.get("active_session") or sessions.ensure_active_session(root_store)
+
+SESSION_ID = active_session()
+
+@st.cache_resource(max_entries=4)
+def session_store(session_id):
+    return sessions.session_store(root_store, session_id)
+
+store = session_store(SESSION_ID)
+
+# Shared per process and session: listener-driven change versions and the snapshot cache on top of them
+@st.cache_resource(max_entries=4)
+def session_live_hub(session_id):
+    return LiveHub(session_store(session_id))
+
+@st.cache_resource(max_entries=4)
+def session_snapshot_cache(session_id):
+    return SnapshotCache(session_store(session_id), session_live_hub(session_id))
+
+def live_hub():
+    return session_live_hub(SESSION_ID)
+
+def snapshot_cache():
+    return session_snapshot_cache(SESSION_ID)
+
+# Every read of this rerun goes through one RerunReads: a node is fetched (or taken
+# from the shared cache) once, and reads below it are served from that snapshot
+reads = RerunReads(snapshot_cache())
+
+def cached_get(path):
+    return reads.get(path)
+
+# Game definition of the active session (action sets, payoff table, number of periods)
+game = game_logic.game_from_node(cached_get("game"))
+
+st.title(f"🎲 Multiplayer {game.periods}-Period Dynamic Game")
+
+def payoff_table_markdown():
+    columns = game.actions[ROLES[1]]
+    lines = ["|     | " + " | ".join(columns) + " |", "|-----" + "|---------" * len(columns) + "|"]
+    for action in game.actions[ROLES[0]]:
+        lines.append(f"| {action}   | " + " | ".join(str(game.payoff(action, column)) for column in columns) + " |")
+    return "\n".join(lines)
 
 # Game description
-st.markdown("""
+st.markdown(f"""
 Game Description  
-You will be matched with another player and play a 2-period dynamic game. In each period, you simultaneously choose an action.  
+You will be matched with another player and play a {game.periods}-period dynamic game. In each period, you simultaneously choose an action.  
 After both players submit, the outcome and payoffs will be shown before moving to the next round.
 
 Payoff Matrix (Player 1, Player 2):
 
-|     | X       | Y       | Z       |
-|-----|---------|---------|---------|
-| A   | (4, 3)  | (0, 0)  | (1, 4)  |
-| B   | (0, 0)  | (2, 1)  | (0, 0)  |
+{payoff_table_markdown()}
 """)
 
-# Firebase credentials and config
-firebase_key = st.secrets["firebase_key"]
-database_url = st.secrets["database_url"]
+@st.cache_resource
+def chart_cache():
+    return ChartCache()
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(json.loads(firebase_key))
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': database_url
-    })
+# Live-view charts: "matplotlib" renders cached PNGs on the server, "vega" ships only the
+# counts to the browser (Vega-Lite). The PDF report always uses matplotlib (see report.py).
+CHART_MODE = setting("chart_mode", "matplotlib")
+if CHART_MODE not in CHART_MODES:
+    CHART_MODE = "matplotlib"
+
+def show_percentage_chart(choice_count, labels, title, style, generated=None):
+    if CHART_MODE == "vega":
+        st.vega_lite_chart(spec=percentage_bar_spec(choice_count, labels, title, style, generated),
+                           use_container_width=True, theme=None)
+    else:
+        st.image(chart_cache().render(choice_count, labels, title, style, generated),
+                 use_container_width=True)
+
+def mark_seen(*keys):
+    # Record the versions this rerun is about to render; keys are (path, child or None)
+    hub = live_hub()
+    seen = {}
+    for path, child in keys:
+        if hub.watch(path):
+            seen[(path, child)] = hub.version(path, child)
+    st.session_state["live_seen"] = seen
+
+WAIT_TICK = 1.0  # seconds between runs of a waiting fragment (jittered per page)
+
+def wait_for_change(key, check=None):
+    # Waiting area as a fragment that reruns only itself instead of holding the script
+    # thread. A tick just compares the listener versions marked in this rerun (in memory);
+    # storage is consulted only when one of them moved or the backoff is due, and check()
+    # returning True - by default any due tick - reruns the whole page. The backoff lives
+    # in the session under key (what is being waited for), so full reruns keep growing it;
+    # it starts over only when a marked version moved or the page waits for something else.
+    hub = live_hub()
+    seen = dict(st.session_state.get("live_seen", {}))
+    state = st.session_state.get("live_wait")
+    if state is None or state["key"] != key:
+        # Without listeners the backoff drives polling; with them it is only a safety net
+        backoff = Backoff() if check is not None or not seen else Backoff(LIVE_WAIT_TIMEOUT, LIVE_WAIT_TIMEOUT)
+        state = st.session_state["live_wait"] = {"key": key, "backoff": backoff, "seen": seen}
+    elif hub.moved(state["seen"]):
+        state["backoff"].reset()
+        state["seen"] = seen
+    backoff = state["backoff"]
+
+    @st.fragment(run_every=WAIT_TICK * random.uniform(0.8, 1.2))
+    def waiting():
+        if not hub.moved(seen) and not backoff.due():
+            return
+        reads.forget()
+        # Checked now: the next poll is due later, whether or not this one reruns the page
+        backoff.idle()
+        if check is None or check():
+            st.rerun()
+        # Unrelated change or nothing new yet: back off from the current versions
+        seen.update({marked: hub.version(*marked) for marked in seen})
+
+    waiting()
+
+def record_submission(match_id, period, role, action, name):
+    game_logic.record_submission(store, match_id, period, role, action, name, game)
+    reads.forget()
+
+def recount_submissions(match_node, match_id, role, name):
+    # A submission whose counting batch failed is counted again from its player's page
+    # once RECOUNT_AFTER has passed; returns those not due yet
+    pending = []
+    for period, submission in game_logic.uncounted_submissions(match_node, role, game):
+        if game_logic.recount_due(submission):
+            record_submission(match_id, period, role, submission["action"], name)
+        else:
+            pending.append(submission)
+    return pending
+
+def remember_player_match(name, match_id, role):
+    st.session_state["player_match"] = {"name": name, "match_id": match_id, "role": role,
+                                        "session": SESSION_ID}
+
+def lookup_player_match(name):
+    # Cached in the session once known - a match never changes for a given player
+    cached = st.session_state.get("player_match")
+    if cached and cached.get("name") == name and cached.get("session") == SESSION_ID:
+        return cached["match_id"], cached["role"]
+    match_id, role = game_logic.lookup_player_match(store, name)
+    if match_id:
+        remember_player_match(name, match_id, role)
+    return match_id, role
+
+def join_queue(name):
+    match_id, role = game_logic.join_queue(store, name)
+    if match_id:
+        remember_player_match(name, match_id, role)
+    return match_id, role
+
+def get_stats():
+    return cached_get("stats") or {}
+
+# Follows events/ from a cursor, so each rerun downloads only the events since the last
+# one and applies them to the views kept per session
+@st.cache_resource(max_entries=4)
+def session_event_view(session_id, game_key):
+    return EventFeed(session_store(session_id)), ReactionTimes(game), PlayerActivity(game)
+
+ACTIVITY_PAGE_SIZE = 25
+
+def event_views():
+    feed, reaction_times, activity = session_event_view(SESSION_ID, game.key)
+    events = feed.poll()
+    reaction_times.apply(events)
+    activity.apply(events)
+    if not activity.seeded:
+        # Players from before the event log existed: one snapshot read per process and session
+        if get_stats().get("registered_players", 0) > len(activity.players):
+            activity.seed(cached_get("players"), cached_get("matches"))
+        activity.seeded = True
+    return reaction_times, activity
+
+@st.cache_resource(max_entries=4)
+def session_frame_cache(session_id):
+    from analytics import FrameCache
+    return FrameCache()
+
+def frame_cache():
+    return session_frame_cache(SESSION_ID)
 
 # BEGIN PDF
-# Function to create comprehensive PDF with all game data and graphs
-def create_comprehensive_pdf():
-    import matplotlib.pyplot as plt
-    import tempfile
-    import os
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib import colors
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    styles = getSampleStyleSheet()
-    story = []
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Title'],
-        fontSize=24,
-        textColor=colors.darkblue,
-        spaceAfter=30
-    )
-    story.append(Paragraph("🎲 Dynamic Game Complete Results", title_style))
-    story.append(Spacer(1, 20))
-    
-    # Get all game data from Firebase
-    all_games = db.reference("games").get() or {}
-    expected_players = db.reference("expected_players").get() or 0
-    
-    # Summary section
-    story.append(Paragraph(f"<b>Game Summary</b>", styles['Heading2']))
-    story.append(Paragraph(f"Expected Players: {expected_players}", styles['Normal']))
-    story.append(Paragraph(f"Total Matches: {len(all_games)}", styles['Normal']))
-    story.append(Spacer(1, 20))
-    
-    # Individual match results
-    story.append(Paragraph("<b>Individual Match Results</b>", styles['Heading2']))
-    
-    # Create table data for all matches
-    table_data = [["Match ID", "Period 1", "Period 1 Payoffs", "Period 2", "Period 2 Payoffs"]]
-    
-    for match_id, game_data in all_games.items():
-        if "period1" in game_data and "period2" in game_data:
-            # Period 1
-            p1_action1 = game_data["period1"].get("Player 1", {}).get("action", "N/A")
-            p2_action1 = game_data["period1"].get("Player 2", {}).get("action", "N/A")
-            payoff_matrix = {
-                "A": {"X": (4, 3), "Y": (0, 0), "Z": (1, 4)},
-                "B": {"X": (0, 0), "Y": (2, 1), "Z": (0, 0)}
-            }
-            if p1_action1 != "N/A" and p2_action1 != "N/A":
-                payoff1 = payoff_matrix[p1_action1][p2_action1]
-            else:
-                payoff1 = "N/A"
-            
-            # Period 2
-            p1_action2 = game_data["period2"].get("Player 1", {}).get("action", "N/A")
-            p2_action2 = game_data["period2"].get("Player 2", {}).get("action", "N/A")
-            if p1_action2 != "N/A" and p2_action2 != "N/A":
-                payoff2 = payoff_matrix[p1_action2][p2_action2]
-            else:
-                payoff2 = "N/A"
-            
-            table_data.append([
-                match_id,
-                f"P1:{p1_action1}, P2:{p2_action1}",
-                str(payoff1),
-                f"P1:{p1_action2}, P2:{p2_action2}",
-                str(payoff2)
-            ])
-    
-    # Create and style the table
-    table = Table(table_data, colWidths=[1.5*inch, 1.5*inch, 1*inch, 1.5*inch, 1*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(table)
-    story.append(Spacer(1, 30))
-    
-    # Generate charts and add to PDF
-    story.append(Paragraph("<b>Statistical Analysis</b>", styles['Heading2']))
-    
-    # Collect choice data
-    p1_choices_r1, p2_choices_r1 = [], []
-    p1_choices_r2, p2_choices_r2 = [], []
-    
-    for match in all_games.values():
-        if "period1" in match:
-            p1 = match["period1"].get("Player 1", {}).get("action")
-            p2 = match["period1"].get("Player 2", {}).get("action")
-            if p1: p1_choices_r1.append(p1)
-            if p2: p2_choices_r1.append(p2)
-        if "period2" in match:
-            p1 = match["period2"].get("Player 1", {}).get("action")
-            p2 = match["period2"].get("Player 2", {}).get("action")
-            if p1: p1_choices_r2.append(p1)
-            if p2: p2_choices_r2.append(p2)
-    
-    # Create temporary directory for chart images
-    temp_dir = tempfile.mkdtemp()
-    
-    def create_enhanced_chart(choices, labels, title, filename, player_type):
-        if len(choices) > 0:
-            import pandas as pd
-            counts = pd.Series(choices).value_counts(normalize=True).reindex(labels, fill_value=0) * 100
-            
-            # Create figure with enhanced styling
-            fig, ax = plt.subplots(figsize=(10, 6))
-            fig.patch.set_facecolor('#f0f0f0')
-            ax.set_facecolor('#e0e0e0')
-            
-            # Color scheme
-            colors_p1 = ['#1f77b4', '#ff7f0e'] if player_type == "P1" else ['#1f77b4', '#ff7f0e', '#2ca02c']
-            
-            # Create bar plot
-            bars = counts.plot(kind='bar', ax=ax, color=colors_p1, linewidth=2)
-            
-            # Enhanced styling
-            ax.set_title(title, fontsize=16, fontweight='bold', pad=20)
-            ax.set_ylabel("Percentage (%)", fontsize=14)
-            ax.set_xlabel("Choice", fontsize=14)
-            ax.tick_params(rotation=0)
-            ax.set_ylim(0, max(100, counts.max() * 1.1))
-            
-            # Add grid
-            ax.grid(True, alpha=0.3, linestyle='-', linewidth=0.5)
-            
-            # Add value labels on bars
-            for i, bar in enumerate(ax.patches):
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., height + 1,
-                       f'{height:.1f}%', ha='center', va='bottom', fontsize=12, fontweight='bold')
-            
-            # Add date
-            today = datetime.today().strftime('%B %d, %Y')
-            ax.text(0.02, 0.98, f"Generated: {today}", transform=ax.transAxes, 
-                   fontsize=10, verticalalignment='top', alpha=0.7)
-            
-            plt.tight_layout()
-            filepath = os.path.join(temp_dir, filename)
-            plt.savefig(filepath, dpi=300, bbox_inches='tight')
-            plt.close()
-            return filepath
-        return None
-    
-    # Generate enhanced charts
-    chart_files = []
-    if p1_choices_r1:
-        chart_files.append(create_enhanced_chart(p1_choices_r1, ["A", "B"], "Player 1 Choices (Period 1)", "p1_r1.png", "P1"))
-    if p2_choices_r1:
-        chart_files.append(create_enhanced_chart(p2_choices_r1, ["X", "Y", "Z"], "Player 2 Choices (Period 1)", "p2_r1.png", "P2"))
-    if p1_choices_r2:
-        chart_files.append(create_enhanced_chart(p1_choices_r2, ["A", "B"], "Player 1 Choices (Period 2)", "p1_r2.png", "P1"))
-    if p2_choices_r2:
-        chart_files.append(create_enhanced_chart(p2_choices_r2, ["X", "Y", "Z"], "Player 2 Choices (Period 2)", "p2_r2.png", "P2"))
-    
-    # Add charts to PDF
-    for chart_file in chart_files:
-        if chart_file and os.path.exists(chart_file):
-            story.append(Image(chart_file, width=6*inch, height=4*inch))
-            story.append(Spacer(1, 20))
-    
-    # Add payoff matrix reference
-    story.append(Paragraph("<b>Payoff Matrix Reference</b>", styles['Heading2']))
-    payoff_data = [
-        ["", "X", "Y", "Z"],
-        ["A", "(4, 3)", "(0, 0)", "(1, 4)"],
-        ["B", "(0, 0)", "(2, 1)", "(0, 0)"]
-    ]
-    payoff_table = Table(payoff_data, colWidths=[1*inch, 1*inch, 1*inch, 1*inch])
-    payoff_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    story.append(payoff_table)
-    story.append(Spacer(1, 20))
-    
-    story.append(Paragraph("Format: (Player 1 Payoff, Player 2 Payoff)", styles['Normal']))
-    story.append(Spacer(1, 20))
-    story.append(Paragraph("✅ Report generated automatically", styles['Normal']))
-    
-    # Build PDF
-    doc.build(story)
-    
-    # Cleanup temporary files
-    for chart_file in chart_files:
-        if chart_file and os.path.exists(chart_file):
-            os.remove(chart_file)
-    os.rmdir(temp_dir)
-    
-    buffer.seek(0)
-    return buffer
+# The comprehensive PDF is built on a background worker and kept per data version, so
+# the dashboard never blocks on it and repeated downloads reuse the finished bytes
+@st.cache_resource
+def report_jobs():
+    from report import ReportJobs
+    return ReportJobs()
+
+REPORT_DPI_OPTIONS = [100, 150, 200, 300]
+
+def report_version(mode, chart_dpi):
+    expected_players = cached_get("expected_players") or 0
+    return SESSION_ID, game.key, expected_players, json.dumps(get_stats(), sort_keys=True), mode, chart_dpi
+
+def start_report(version):
+    from report import build_report
+
+    # Capture the shared objects here - the worker thread has no Streamlit context
+    cache, frames, hub, definition = snapshot_cache(), frame_cache(), live_hub(), game
+
+    def build():
+        games, token = cache.get_versioned("games")
+        return build_report(frames.get(games, token, definition), version[2], chart_dpi=version[5],
+                            mode=version[4], game=definition)
+
+    return report_jobs().submit(version, build, on_done=lambda: hub.touch("report"))
    
 # END PDF
 
+def export_game_data(fmt):
+    # Streams games/ page by page into a temporary file; only the file path is kept
+    previous = st.session_state.pop("export_file", None)
+    if previous and os.path.exists(previous["path"]):
+        os.remove(previous["path"])
+    with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as out:
+        rows = export_games(store, fmt, out, game=game)
+    st.session_state["export_file"] = {"path": out.name, "format": fmt, "rows": rows}
+
 # Password protection for admin functions only
 admin_password = st.text_input("Admin Password (for database management):", type="password")
 
 if admin_password == "admin123":
     st.header("🔒 Admin Dashboard")
+    rerun_calls["page"] = "admin"
+    import pandas as pd
+    from report import REPORT_CHART_DPI, REPORT_MODES
     
     # Get real-time data
-    all_players = db.reference("players").get() or {}
-    all_matches = db.reference("matches").get() or {}
-    all_games = db.reference("games").get() or {}
-    expected_players = db.reference("expected_players").get() or 0
-    
-    # Calculate participation statistics
-    total_registered = len(all_players)
-    matched_players = set()
-    for match in all_matches.values():
-        matched_players.update(match.get("players", []))
+    # Every registration, match and submission bumps a stats/ counter
+    mark_seen(("stats", None), ("expected_players", None))
+    stats = get_stats()
+    expected_players = cached_get("expected_players") or 0
     
-    completed_period1_players = set()
-    completed_period2_players = set()
-    
-    for game in all_games.values():
-        if "period1" in game:
-            for player in game["period1"].keys():
-                completed_period1_players.add(player)
-        if "period2" in game:
-            for player in game["period2"].keys():
-                completed_period2_players.add(player)
+    # Calculate participation statistics from the stats/ counters (a few bytes)
+    total_registered = game_logic.stat_count(store, stats, "registered_players", "players")
+    matched_count = 2 * game_logic.stat_count(store, stats, "matches", "matches")
+    completed_count = stats.get("completed_players", 0)
     
     # Live Statistics Dashboard
     st.subheader("📊 Live Game Statistics")
@@ -292,139 +334,146 @@ if admin_password == "admin123":
     with col2:
         st.metric("Registered Players", total_registered)
     with col3:
-        st.metric("Matched Players", len(matched_players))
+        st.metric("Matched Players", matched_count)
     with col4:
-        st.metric("Completed Period 2", len(completed_period2_players))
+        st.metric(f"Completed {period_label(game.period_names[-1])}", completed_count)
+    
+    cache_counts = snapshot_cache().counts()
+    st.caption(f"Shared snapshot cache: {cache_counts['hits']} hits / {cache_counts['misses']} misses "
+               f"({cache_counts['entries']} cached paths)")
+    player_reruns = [entry["calls"] for entry in rerun_tracker().recent("player")]
+    if player_reruns:
+        st.caption(f"Player reruns: {sum(player_reruns) / len(player_reruns):.1f} storage calls on average, "
+                   f"{max(player_reruns)} at most (last {len(player_reruns)} reruns)")
     
     # Participation Progress Bar
     if expected_players > 0:
-        progress_percentage = min(len(completed_period2_players) / expected_players, 1.0)
+        progress_percentage = min(completed_count / expected_players, 1.0)
         st.progress(progress_percentage)
-        st.write(f"Progress: {len(completed_period2_players)}/{expected_players} players completed ({progress_percentage*100:.1f}%)")
+        st.write(f"Progress: {completed_count}/{expected_players} players completed ({progress_percentage*100:.1f}%)")
     
-    # Live Player Activity Monitoring
+    # Live Player Activity Monitoring - per-player status is kept up to date from the event
+    # log; only the counts and one page of the selected view are rendered
     st.subheader("👥 Player Activity Monitor")
-    
-    if all_players:
-        player_status = []
-        for player_name in all_players.keys():
-            status = "🔴 Registered"
-            current_activity = "Waiting to be matched"
-            
-            if player_name in matched_players:
-                status = "🟡 Matched"
-                current_activity = "Matched with partner"
-                
-            if player_name in completed_period1_players:
-                status = "🔵 Period 1 Done"
-                current_activity = "Completed Period 1"
-                
-            if player_name in completed_period2_players:
-                status = "🟢 Completed"
-                current_activity = "Game finished"
-            
-            player_status.append({
-                "Player Name": player_name,
-                "Status": status,
-                "Activity": current_activity
-            })
+    reaction_view, activity = event_views()
+    if activity.players:
+        activity_counts = activity.summary()
+        views = {None: f"All players ({len(activity.players)})"}
+        views.update({category: f"{label} ({activity_counts[category]})"
+                      for category, label in ACTIVITY_CATEGORIES.items()})
+        views["stuck"] = f"🧊 Stuck > {STUCK_AFTER // 60} min ({activity_counts['stuck']})"
+        columns = st.columns(len(views) - 1)
+        for column, category in zip(columns, list(views)[1:]):
+            with column:
+                st.metric(views[category].rsplit(" (", 1)[0], activity_counts[category])
         
-        # Display as a table
-        if player_status:
-            status_df = pd.DataFrame(player_status)
-            st.dataframe(status_df, use_container_width=True)
+        selected_view = st.selectbox("Show:", list(views), format_func=views.get, key="activity_view")
+        total_rows = activity.page(selected_view, limit=0)[0]
+        pages = max(1, -(-total_rows // ACTIVITY_PAGE_SIZE))
+        page_number = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1,
+                                      key="activity_page") if pages > 1 else 1
+        _, rows = activity.page(selected_view, offset=(page_number - 1) * ACTIVITY_PAGE_SIZE,
+                                limit=ACTIVITY_PAGE_SIZE)
+        if rows:
+            now = time.time()
+            st.dataframe(pd.DataFrame([{
+                "Player Name": row["player"],
+                "Status": row["status"],
+                "Activity": row["activity"],
+                "Match": row["match_id"] or "",
+                "In state for": f"{int(now - row['since']) // 60} min {int(now - row['since']) % 60} s"
+                if row["since"] else ""
+            } for row in rows]), hide_index=True, use_container_width=True)
+            st.caption(f"{total_rows} players in this view, page {page_number} of {pages}")
+        else:
+            st.info("No players in this view.")
     else:
         st.info("No players registered yet.")
     
     # Live Choice Analytics
     st.subheader("📈 Live Choice Analytics")
     
-    if all_games:
-        # Collect choice data for Period 1
-        p1_choices_r1, p2_choices_r1 = [], []
-        p1_choices_r2, p2_choices_r2 = [], []
+    if stats:
+        # Enhanced admin charts - cached PNGs or browser-side Vega-Lite (see CHART_MODE)
+        def plot_admin_chart(choice_count, labels, title, player_type):
+            show_percentage_chart(choice_count, labels, title, "admin")
         
-        for match in all_games.values():
-            if "period1" in match:
-                p1_action = match["period1"].get("Player 1", {}).get("action")
-                p2_action = match["period1"].get("Player 2", {}).get("action")
-                if p1_action: p1_choices_r1.append(p1_action)
-                if p2_action: p2_choices_r1.append(p2_action)
-            if "period2" in match:
-                p1_action = match["period2"].get("Player 1", {}).get("action")
-                p2_action = match["period2"].get("Player 2", {}).get("action")
-                if p1_action: p1_choices_r2.append(p1_action)
-                if p2_action: p2_choices_r2.append(p2_action)
-        
-        # Enhanced admin charts function
-        def plot_admin_chart(choices, labels, title, player_type):
-            if len(choices) > 0:
-                counts = pd.Series(choices).value_counts(normalize=True).reindex(labels, fill_value=0) * 100
-                
-                fig, ax = plt.subplots(figsize=(8, 5))
-                fig.patch.set_facecolor('#f8f9fa')
-                ax.set_facecolor('#ffffff')
-                
-                colors_scheme = ['#e74c3c', '#3498db'] if player_type == "P1" else ['#e74c3c', '#3498db', '#2ecc71']
-                
-                bars = counts.plot(kind='bar', ax=ax, color=colors_scheme, linewidth=2, width=0.6)
-                
-                ax.set_title(title, fontsize=14, fontweight='bold', pad=15)
-                ax.set_ylabel("Percentage (%)", fontsize=12)
-                ax.set_xlabel("Choice", fontsize=12)
-                ax.tick_params(rotation=0, labelsize=10)
-                ax.set_ylim(0, max(100, counts.max() * 1.1))
-                
-                ax.grid(True, alpha=0.2, linestyle='-', linewidth=0.5)
-                
-                # Add value labels
-                for i, bar in enumerate(ax.patches):
-                    height = bar.get_height()
-                    ax.text(bar.get_x() + bar.get_width()/2., height + 2,
-                           f'{height:.1f}%', ha='center', va='bottom', fontsize=10, fontweight='bold')
-                
-                # Add sample info
-                ax.text(0.02, 0.95, f"n={len(choices)}", transform=ax.transAxes, 
-                       fontsize=9, bbox=dict(boxstyle='round,pad=0.3', facecolor='lightgray', alpha=0.7))
-                
-                plt.tight_layout()
-                return fig
-            else:
-                # Create empty chart
-                fig, ax = plt.subplots(figsize=(8, 5))
-                ax.text(0.5, 0.5, f'No data yet for {title}', ha='center', va='center', 
-                       fontsize=12, transform=ax.transAxes)
-                ax.set_title(title, fontsize=14, fontweight='bold')
-                return fig
-        
-        # Period 1 Charts
-        st.markdown("**Period 1 Choices**")
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            fig1 = plot_admin_chart(p1_choices_r1, ["A", "B"], "Player 1 Choices (Period 1)", "P1")
-            st.pyplot(fig1)
-            
-        with col2:
-            fig2 = plot_admin_chart(p2_choices_r1, ["X", "Y", "Z"], "Player 2 Choices (Period 1)", "P2")
-            st.pyplot(fig2)
-        
-        # Period 2 Charts
-        if p1_choices_r2 or p2_choices_r2:
-            st.markdown("**Period 2 Choices**")
-            col3, col4 = st.columns(2)
-            
-            with col3:
-                fig3 = plot_admin_chart(p1_choices_r2, ["A", "B"], "Player 1 Choices (Period 2)", "P1")
-                st.pyplot(fig3)
-                
-            with col4:
-                fig4 = plot_admin_chart(p2_choices_r2, ["X", "Y", "Z"], "Player 2 Choices (Period 2)", "P2")
-                st.pyplot(fig4)
+        # One row of charts per period, from the first one with any data
+        for index, period in enumerate(game.period_names):
+            counts = {role: choice_counts(stats, period, role, game.actions[role]) for role in ROLES}
+            if index > 0 and not any(sum(role_counts.values()) for role_counts in counts.values()):
+                continue
+            st.markdown(f"**{period_label(period)} Choices**")
+            columns = st.columns(len(ROLES))
+            for column, role in zip(columns, ROLES):
+                with column:
+                    plot_admin_chart(counts[role], game.actions[role],
+                                     f"{role} Choices ({period_label(period)})", f"P{ROLES.index(role) + 1}")
+
+        # Outcomes and period-to-period transitions, from counters kept up to date per
+        # submission (stats/joint, stats/payoffs, stats/transitions) - no scan of games/
+        st.markdown("**🔀 Outcomes and Transitions**")
+        outcome_labels = [f"{action1} / {action2}" for action1, action2 in transitions.previous_outcomes(game)]
+        for index, period in enumerate(game.period_names):
+            joint = transitions.joint_table(stats, period, game)
+            tables = {role: transitions.transition_table(stats, period, role, game) for role in ROLES} if index else {}
+            if not joint.sum() and not any(table.sum() for table in tables.values()):
+                continue
+            means = transitions.mean_payoffs(stats, period, game)
+            st.markdown(f"*{period_label(period)}*: {joint.sum()} finished outcomes" + "".join(
+                f", mean {role} payoff {means[role]:.2f}" for role in ROLES if means[role] is not None
+            ))
+            st.dataframe(pd.DataFrame(joint, index=pd.Index(game.actions[ROLES[0]], name="P1 \\ P2"),
+                                      columns=game.actions[ROLES[1]]))
+            columns = st.columns(len(ROLES))
+            for column, (role, table) in zip(columns, tables.items()):
+                with column:
+                    st.markdown(f"{role} choice by {period_label(game.period_names[index - 1])} outcome (P1 / P2)")
+                    observed = table.sum(axis=1) > 0
+                    if not observed.any():
+                        st.caption("No choices yet.")
+                        continue
+                    shares = pd.DataFrame(table / table.sum(axis=1, keepdims=True).clip(min=1) * 100,
+                                          index=outcome_labels, columns=game.actions[role])[observed].round(1)
+                    shares["n"] = table.sum(axis=1)[observed]
+                    st.dataframe(shares)
+                    test = transitions.independence_test(table)
+                    if test:
+                        st.caption(f"χ² = {test['chi2']:.2f} (df {test['dof']}), p = {test['p_value']:.3f}, "
+                                   f"n = {test['n']}" + (" - expected counts below 5, treat with care"
+                                                         if test["min_expected"] < 5 else ""))
+        if st.button("🔁 Recount Transitions from Game Data"):
+            # For sessions that started before these counters existed; run it while nobody plays
+            counters = transitions.transition_counters(cached_get("games"), game)
+            batch = store.batch("recount")
+            for name, counts in counters.items():
+                batch.set(f"stats/{name}", counts)
+            batch.commit()
+            st.rerun()
+
+    # Event log: registrations, matches and submissions as they happened
+    st.subheader("🧾 Event Log")
+    st.write(", ".join(f"{count} {kind} events" for kind, count in sorted(reaction_view.counts.items()))
+             or "No events yet.")
+    reaction_times = reaction_view.summary()
+    if reaction_times:
+        st.markdown("**Reaction times** (seconds from a period opening to the submission)")
+        st.dataframe(pd.DataFrame([{
+            "Period": period_label(row["period"]), "Role": row["role"], "n": row["n"],
+            "Mean": round(row["mean"], 1), "Median": round(row["median"], 1), "p90": round(row["p90"], 1)
+        } for row in reaction_times]), hide_index=True)
+    if reaction_view.recent:
+        with st.expander("Latest events"):
+            st.dataframe(pd.DataFrame([{
+                "Time": datetime.fromtimestamp(event["timestamp"]).strftime("%H:%M:%S"),
+                "Type": event.get("type"),
+                "Detail": " ".join(f"{key}={value}" for key, value in event.items()
+                                   if key not in ("type", "timestamp"))
+            } for event in reversed(reaction_view.recent)]), hide_index=True)
     
     # Game Configuration
     st.subheader("⚙️ Game Configuration")
-    current_expected = db.reference("expected_players").get() or 0
+    current_expected = cached_get("expected_players") or 0
     st.write(f"Current expected players: {current_expected}")
     
     new_expected_players = st.number_input(
@@ -438,55 +487,195 @@ if admin_password == "admin123":
     
     if st.button("⚙ Update Expected Players"):
         if new_expected_players % 2 == 0:  # Must be even for pairing
-            db.reference("expected_players").set(new_expected_players)
+            store.set("expected_players", new_expected_players)
             st.success(f"✅ Expected players set to {new_expected_players}")
             st.rerun()
         else:
             st.error("⚠ Number of players must be even (for pairing)")
     
+    # Game definition - can only change before the first match of the session
+    with st.expander("🎲 Game Definition"):
+        new_periods = st.number_input("Number of periods:", min_value=1, max_value=20, value=game.periods)
+        new_definition = st.text_area(
+            "Action sets and payoff table (JSON):",
+            value=json.dumps({"actions": game.actions, "payoffs": game.table.tolist()}),
+            help='{"actions": {"Player 1": [...], "Player 2": [...]}, "payoffs": [[[p1, p2], ...], ...]} '
+                 "- one row per Player 1 action, one (Player 1, Player 2) pair per Player 2 action"
+        )
+        if st.button("⚙ Update Game Definition"):
+            if get_stats().get("matches", 0) > 0:
+                st.error("⚠ Matches have already started in this session - archive it to change the game")
+            else:
+                try:
+                    definition = json.loads(new_definition)
+                    updated = game_logic.GameDefinition(definition["actions"], definition["payoffs"], new_periods)
+                except (ValueError, KeyError, TypeError) as e:
+                    st.error(f"⚠ Invalid game definition: {str(e)}")
+                else:
+                    store.set("game", updated.to_dict())
+                    st.success("✅ Game definition updated")
+                    st.rerun()
+    
     # Game Management
     st.subheader("📄 Game Management")
     
-    # PDF Download
-    if st.button("📄 Download Complete Game Report (PDF)"):
-        with st.spinner("Generating comprehensive PDF report..."):
+    # PDF Download - generated in the background for the current data version
+    col1, col2 = st.columns(2)
+    with col1:
+        report_mode = st.radio(
+            "Report layout:", REPORT_MODES, horizontal=True,
+            format_func=lambda mode: "Full (all matches)" if mode == "full" else "Summary only",
+            help="Summary only skips the per-match table - recommended for large cohorts"
+        )
+    with col2:
+        default_dpi = int(setting("report_chart_dpi", REPORT_CHART_DPI))
+        dpi_options = sorted(set(REPORT_DPI_OPTIONS) | {default_dpi})
+        report_dpi = st.selectbox("Chart resolution (DPI):", dpi_options, index=dpi_options.index(default_dpi))
+    version = report_version(report_mode, report_dpi)
+    report_job = report_jobs().get(version)
+    if st.button("📄 Generate Complete Game Report (PDF)"):
+        report_job = start_report(version)
+    report_pending = report_job is not None and not report_job.done()
+    if report_pending:
+        st.info("⏳ Generating comprehensive PDF report in the background...")
+        st.session_state["live_seen"][("report", None)] = live_hub().version("report")
+    elif report_job is not None:
+        if report_job.exception() is not None:
+            st.error(f"Error generating PDF: {str(report_job.exception())}")
+        else:
+            st.download_button(
+                "⬇ Download Complete Game Report",
+                data=report_job.result(),
+                file_name="complete_game_results.pdf",
+                mime="application/pdf"
+            )
+            st.success("✅ Complete game report generated successfully!")
+    
+    # Bulk export of every submission as tidy rows
+    export_format = st.selectbox("Export format:", EXPORT_FORMATS, format_func=str.upper)
+    if st.button("📤 Export Game Data"):
+        with st.spinner("Exporting game data..."):
             try:
-                pdf_buffer = create_comprehensive_pdf()
-                b64 = base64.b64encode(pdf_buffer.read()).decode()
-                href = f'<a href="data:application/pdf;base64,{b64}" download="complete_game_results.pdf">Click here to download Complete Game Report</a>'
-                st.markdown(href, unsafe_allow_html=True)
-                st.success("✅ Complete game report generated successfully!")
+                export_game_data(export_format)
             except Exception as e:
-                st.error(f"Error generating PDF: {str(e)}")
+                st.error(f"Error exporting game data: {str(e)}")
+    export_file = st.session_state.get("export_file")
+    if export_file and os.path.exists(export_file["path"]):
+        with open(export_file["path"], "rb") as exported:
+            st.download_button(
+                f"⬇ Download {export_file['format'].upper()} ({export_file['rows']} rows)",
+                data=exported,
+                file_name=f"game_data.{export_file['format']}",
+                mime=EXPORT_MIME_TYPES[export_file["format"]]
+            )
+    
+    # Payoff ledger (per player and match, kept up to date as periods finish) for payouts
+    if st.button("💰 Prepare Payoff Ledger"):
+        ledger = io.BytesIO()
+        st.session_state["ledger_csv"] = (export_ledger(store, ledger), ledger.getvalue())
+    if "ledger_csv" in st.session_state:
+        ledger_rows, ledger_csv = st.session_state["ledger_csv"]
+        st.download_button(f"⬇ Download Payoff Ledger ({ledger_rows} rows)", data=ledger_csv,
+                           file_name=f"payoff_ledger_{SESSION_ID}.csv", mime="text/csv")
+    
+    # Sessions: archive the finished cohort and start an empty one
+    st.subheader("🗂 Sessions")
+    st.write(f"Active session: `{SESSION_ID}`")
+    if st.button("📦 Archive Session and Start a New One"):
+        new_session = sessions.archive_session(root_store, SESSION_ID, setting("archive_dir"))
+        st.success(f"✅ Session {SESSION_ID} archived. New session: {new_session}")
+        st.rerun()
     
-    # Database cleanup
+    archived = sessions.list_archives(root_store)
+    if archived:
+        archive_id = st.selectbox("Archived sessions:", archived[::-1])
+        if st.button("📂 Load Archived Session"):
+            st.download_button(
+                f"⬇ Download {archive_id} (JSON)",
+                data=json.dumps(sessions.load_archive(root_store, archive_id)),
+                file_name=f"{archive_id}.json",
+                mime="application/json"
+            )
+
+    # Performance: storage calls per path group, rerun rates and chart render times,
+    # all collected in-process since the server started (or the last reset)
+    st.subheader("⏱ Performance")
+    with st.expander("Storage calls, reruns and render times"):
+        storage_rows = root_store.snapshot()
+        rerun_stats = rerun_tracker().to_dict()
+        if previous_rerun:
+            st.caption(f"🔌 Your last rerun: {previous_rerun['calls']} storage calls, "
+                       f"{previous_rerun['seconds'] * 1000:.0f} ms, {previous_rerun['bytes']} bytes")
+        chart_stats = chart_cache().counts()
+        if storage_rows:
+            st.dataframe(pd.DataFrame([{
+                "Operation": row["operation"],
+                "Path": row["path"],
+                "Calls": row["calls"],
+                "Mean ms": row["latency"]["mean_ms"],
+                "p95 ms": row["latency"]["p95_ms"],
+                "Max ms": row["latency"]["max_ms"],
+                "Bytes": row["bytes"]
+            } for row in storage_rows]), hide_index=True)
+            latency_path = st.selectbox("Latency histogram for:", [
+                f"{row['operation']} {row['path']}" for row in storage_rows
+            ])
+            buckets = storage_rows[[f"{row['operation']} {row['path']}" for row in storage_rows]
+                                   .index(latency_path)]["latency"]["buckets"]
+            st.bar_chart(pd.Series(buckets, name="calls"))
+        st.write(f"Logged reruns: {rerun_stats['logged_reruns']} - storage calls per rerun: " + ", ".join(
+            f"{page} {calls:.1f}" for page, calls in rerun_stats["calls_per_rerun"].items()
+        ))
+        if rerun_stats["reruns_per_minute"]:
+            st.dataframe(pd.DataFrame(
+                sorted(rerun_stats["reruns_per_minute"].items(), key=lambda item: -item[1]),
+                columns=["Browser session", "Reruns / min (last 5 min)"]
+            ), hide_index=True)
+        render_times = chart_stats["render_times"]
+        if render_times["count"]:
+            st.write(f"Chart renders: {render_times['count']} (mean {render_times['mean_ms']:.0f} ms, "
+                     f"p95 ≤ {render_times['p95_ms']} ms, {chart_stats['hits']} cache hits)")
+        st.download_button(
+            "⬇ Download Metrics (JSON)",
+            data=json.dumps({
+                "generated_at": time.time(),
+                "storage": storage_rows,
+                "reruns": rerun_stats,
+                "charts": chart_stats,
+                "snapshot_cache": snapshot_cache().counts()
+            }, indent=2),
+            file_name="performance_metrics.json",
+            mime="application/json"
+        )
+        if st.button("♻ Reset Storage Metrics"):
+            root_store.reset()
+            st.rerun()
+
+    # Database cleanup (active session only - archived sessions are kept)
     if st.button("🗑 Delete ALL Game Data"):
-        db.reference("games").delete()
-        db.reference("matches").delete()
-        db.reference("players").delete()
-        db.reference("expected_players").set(0)
-        st.success("🧹 ALL game data deleted from Firebase.")
+        game_logic.reset_game(store)
+        session_event_view.clear()
+        st.success(f"🧹 ALL game data of session {SESSION_ID} deleted from Firebase.")
         st.warning("⚠ All players, matches, and game history have been permanently removed.")
         st.rerun()
     
     # Auto-refresh admin dashboard - STOP when all players complete
-    all_completed = expected_players > 0 and len(completed_period2_players) >= expected_players
+    all_completed = expected_players > 0 and completed_count >= expected_players
     
-    if all_completed:
+    if all_completed and not report_pending:
         # All completed - stop auto refresh permanently
         st.success("🎉 All participants completed! Admin monitoring complete.")
         if st.button("🔄 Manual Refresh Dashboard"):
             st.rerun()
     else:
-        # Only auto-refresh if not all completed
-        time.sleep(3)
-        st.rerun()
+        # Only auto-refresh if not all completed - wakes up as soon as the data changes
+        wait_for_change("admin")
     
     # Stop here - admin doesn't participate in the game
     st.stop()
 
 # Check if expected players is set
-if (db.reference("expected_players").get() or 0) <= 0:
+if (cached_get("expected_players") or 0) <= 0:
     st.info("⚠️ Game not configured yet. Admin needs to set expected number of players.")
     st.stop()
 
@@ -494,337 +683,151 @@ if (db.reference("expected_players").get() or 0) <= 0:
 already_matched = False
 match_id = None
 role = None
-pair = None
 
 name = st.text_input("Enter your name to join the game:")
 
 if name:
     st.success(f"👋 Welcome, {name}!")
 
-    player_ref = db.reference(f"players/{name}")
-    player_data = player_ref.get()
+    # Keyed membership check; registration itself is a transaction on players/{name}
+    player_data = cached_get(f"players/{name}")
 
-    if not player_data:
-        player_ref.set({
-            "joined": True,
-            "timestamp": time.time()
-        })
+    if not player_data and game_logic.register_player(store, name):
         st.write("✅ Firebase is connected and you are registered.")
 
-    match_ref = db.reference("matches")
-    match_data = match_ref.get() or {}
-
     # Check if player already matched
     already_matched = False
-    for match_id, info in match_data.items():
-        if name in info.get("players", []):
-            role = "Player 1" if info["players"][0] == name else "Player 2"
-            st.success(f"🎮 Hello, {name}! You are {role} in match {match_id}")
-            already_matched = True
-            break
+    match_id, role = lookup_player_match(name)
+    if match_id:
+        st.success(f"🎮 Hello, {name}! You are {role} in match {match_id}")
+        already_matched = True
 
     if not already_matched:
         # Check if all expected players have finished playing
-        expected_players_ref = db.reference("expected_players")
-        expected_players = expected_players_ref.get() or 0
-        all_games = db.reference("games").get() or {}
-        
-        # Count completed players
-        completed_players = 0
-        for match_id, game_data in all_games.items():
-            if "period1" in game_data and "period2" in game_data:
-                if "Player 1" in game_data["period1"] and "Player 2" in game_data["period1"] \
-                and "Player 1" in game_data["period2"] and "Player 2" in game_data["period2"]:
-                    completed_players += 2
+        expected_players = cached_get("expected_players") or 0
+        completed_players = get_stats().get("completed_players", 0)
         
         # If all expected players have completed, no more matches allowed
         if expected_players >= 0 and completed_players >= expected_players:
             st.info("🎯 All games have been completed! No more matches are available.")
             st.info("📊 Check the Game Summary section below to see the results.")
         else:
-            # Get fresh data to avoid race conditions
-            players_data = db.reference("players").get() or {}
-            match_data = db.reference("matches").get() or {}
-            
-            unmatched = [p for p in players_data.keys()
-                         if not any(p in m.get("players", []) for m in match_data.values())
-                         and p != name]
-
-            if unmatched:
-                partner = unmatched[0]
-                pair = sorted([name, partner])
-                match_id = f"{pair[0]}_vs_{pair[1]}"
-                
-                # Double-check that the match doesn't already exist (race condition protection)
-                existing_match = match_ref.child(match_id).get()
-                if not existing_match:
-                    match_ref.child(match_id).set({"players": pair})
-                    role = "Player 1" if pair[0] == name else "Player 2"
-                    st.success(f"🎮 Hello, {name}! You are {role} in match {match_id}")
-                else:
-                    # Match was created by another player, check our role
-                    role = "Player 1" if existing_match["players"][0] == name else "Player 2"
-                    st.success(f"🎮 Hello, {name}! You are {role} in match {match_id}")
-                    already_matched = True
+            match_id, role = join_queue(name)
+            if match_id:
+                st.success(f"🎮 Hello, {name}! You are {role} in match {match_id}")
+                already_matched = True
             else:
                 st.info("⏳ Waiting for another player to join...")
-                with st.spinner("Checking for match..."):
-                    timeout = 30
-                    for i in range(timeout):
-                        match_data = match_ref.get() or {}
-                        for match_id, info in match_data.items():
-                            if name in info.get("players", []):
-                                role = "Player 1" if info["players"][0] == name else "Player 2"
-                                st.success(f"🎮 Hello, {name}! You are {role} in match {match_id}")
-                                already_matched = True
-                                st.rerun()
-                        time.sleep(2)
-
-    # ✅ Once matched, proceed to Period 1 gameplay
-    if already_matched or role is not None:
-        match_id = match_id if already_matched else f"{pair[0]}_vs_{pair[1]}"
-        role = role if already_matched else ("Player 1" if pair[0] == name else "Player 2")
-        game_ref = db.reference(f"games/{match_id}/period1")
-
-        # Check if both players already completed Period 1
-        period1_data = game_ref.get()
-        if period1_data and "Player 1" in period1_data and "Player 2" in period1_data:
-            # Both players have submitted - show results and automatically go to Period 2
-            action1 = period1_data["Player 1"]["action"]
-            action2 = period1_data["Player 2"]["action"]
-            payoff_matrix = {
-                "A": {"X": (4, 3), "Y": (0, 0), "Z": (1, 4)},
-                "B": {"X": (0, 0), "Y": (2, 1), "Z": (0, 0)}
-            }
-            payoff = payoff_matrix[action1][action2]
-            st.success(f"🎯 Period 1 Outcome: P1 = {action1}, P2 = {action2} → Payoffs = {payoff}")
-            
-            # Automatically set flag to go to Period 2
-            st.session_state["go_to_period2"] = True
-        else:
-            # Display available choices for Period 1
-            st.subheader("🎮 Period 1: Make Your Choice")
+                # The partner's join writes player_match/{name}; claim it from the queue then
+                mark_seen(("player_match", name))
+                wait_for_change(("match", name), lambda: join_queue(name)[0] is not None)
+
+    # ✅ Once matched, play the periods in order - one read of the match node per rerun
+    if already_matched:
+        mark_seen(("games", match_id))
+        match_node = cached_get(f"games/{match_id}") or {}
+        outcomes, current_period = game.progress(match_node)
+        uncounted = recount_submissions(match_node, match_id, role, name)
+        recount_ready = lambda: any(game_logic.recount_due(submission) for submission in uncounted)
+        waiting_for_partner = False
+        
+        # Finished periods: show their outcomes
+        for period, action1, action2, payoff in outcomes:
+            st.success(f"🎯 {period_label(period)} Outcome: P1 = {action1}, P2 = {action2} → Payoffs = {payoff}")
+        
+        if current_period:
+            label = period_label(current_period)
+            if outcomes:
+                st.subheader(f"🔁 {label}: Make Your Choice (Knowing {period_label(outcomes[-1][0])} Outcome)")
+            else:
+                st.subheader(f"🎮 {label}: Make Your Choice")
             
-            existing_action = game_ref.child(role).get()
+            existing_action = (match_node.get(current_period) or {}).get(role)
             if existing_action:
                 st.info(f"✅ You already submitted: {existing_action['action']}")
-                st.info("⏳ Waiting for the other player to submit...")
+                st.info(f"⏳ Waiting for the other player to submit their {label} action...")
                 
-                # Auto-refresh to check for other player's submission
-                time.sleep(2)
-                st.rerun()
+                # Wait for the other player's submission to arrive (or a recount to fall due)
+                wait_for_change(
+                    ("period", match_id, current_period),
+                    lambda: game.progress(cached_get(f"games/{match_id}") or {})[1] != current_period
+                    or recount_ready()
+                )
+                waiting_for_partner = True
             else:
-                if role == "Player 1":
-                    choice = st.radio("Choose your action:", ["A", "B"])
-                else:
-                    choice = st.radio("Choose your action:", ["X", "Y", "Z"])
-
-                if st.button("Submit Choice"):
-                    game_ref.child(role).set({
-                        "action": choice,
-                        "timestamp": time.time()
-                    })
-                    st.success("✅ Your choice has been submitted!")
-                    time.sleep(1)
-                    st.rerun()
-
-        # ✅ Period 2 logic (automatically triggered after Period 1 completes)
-        if st.session_state.get("go_to_period2", False):
-            st.subheader("🔁 Period 2: Make Your Choice (Knowing Period 1 Outcome)")
-
-            # Ensure match_id is properly set
-            if not match_id and pair:
-                match_id = f"{pair[0]}_vs_{pair[1]}"
-            period1_data = db.reference(f"games/{match_id}/period1").get()
-            if period1_data and "Player 1" in period1_data and "Player 2" in period1_data:
-                action1 = period1_data["Player 1"]["action"]
-                action2 = period1_data["Player 2"]["action"]
-                payoff_matrix = {
-                    "A": {"X": (4, 3), "Y": (0, 0), "Z": (1, 4)},
-                    "B": {"X": (0, 0), "Y": (2, 1), "Z": (0, 0)}
-                }
-                period1_payoff = payoff_matrix[action1][action2]
-                st.info(f"📢 In Period 1: P1 = {action1}, P2 = {action2} → Payoffs = {period1_payoff}")
-
-            # Let players choose again for Period 2
-            game_ref2 = db.reference(f"games/{match_id}/period2")
-
-            # Check if both players already completed Period 2
-            period2_data = game_ref2.get()
-            if period2_data and "Player 1" in period2_data and "Player 2" in period2_data:
-                # Both players completed - show final results first
-                action1_2 = period2_data["Player 1"]["action"]
-                action2_2 = period2_data["Player 2"]["action"]
-                payoff_matrix = {
-                    "A": {"X": (4, 3), "Y": (0, 0), "Z": (1, 4)},
-                    "B": {"X": (0, 0), "Y": (2, 1), "Z": (0, 0)}
-                }
-                payoff2 = payoff_matrix[action1_2][action2_2]
-                
-                # Show results first
-                st.success(f"🎯 Period 2 Outcome: P1 = {action1_2}, P2 = {action2_2} → Payoffs = {payoff2}")
-                st.markdown("✅ Game Complete! Thanks for playing.")
-                
-                # Initialize variables for PDF functionality
-                st.session_state["game_complete"] = True
-                st.session_state["match_id"] = match_id
-                st.session_state["action1"] = action1
-                st.session_state["action2"] = action2
-                st.session_state["period1_payoff"] = period1_payoff
-                st.session_state["action1_2"] = action1_2
-                st.session_state["action2_2"] = action2_2
-                st.session_state["payoff2"] = payoff2
-                st.session_state["pair"] = pair
-                
-                # Check if all players finished
-                expected_players = db.reference("expected_players").get() or 0
-                all_games_check = db.reference("games").get() or {}
-                completed_check = 0
-                for mid, gdata in all_games_check.items():
-                    if "period1" in gdata and "period2" in gdata:
-                        if "Player 1" in gdata["period1"] and "Player 2" in gdata["period1"] \
-                        and "Player 1" in gdata["period2"] and "Player 2" in gdata["period2"]:
-                            completed_check += 2
-                
-                if expected_players > 0 and completed_check >= expected_players:
-                    st.success("🎉 All players have finished! Results are now available below.")
-                    st.info("📊 Scroll down to see the complete game results and charts.")
-                    st.session_state["all_games_complete"] = True
+                choice = st.radio(f"Choose your {label} action:", game.actions[role], key=f"choice_{current_period}")
                 
-                # 🎈 BALLOONS CELEBRATION after showing results! 🎈
-                if not st.session_state.get("balloons_shown", False):
-                    st.balloons()
-                    st.session_state["balloons_shown"] = True
-                
-                # Show immediate game summary for this player
-                st.session_state["show_immediate_results"] = True
-            else:
-                # Period 2 gameplay
-                existing_action2 = game_ref2.child(role).get()
-                if existing_action2:
-                    st.info(f"✅ You already submitted: {existing_action2['action']}")
-                    st.info("⏳ Waiting for the other player to submit their Period 2 action...")
-                    
-                    # Auto-refresh to check for other player's submission
-                    time.sleep(2)
+                if st.button(f"Submit {label} Choice"):
+                    record_submission(match_id, current_period, role, choice, name)
+                    st.success(f"✅ Your {label} choice has been submitted!")
+                    time.sleep(1)
                     st.rerun()
-                else:
-                    if role == "Player 1":
-                        choice2 = st.radio("Choose your Period 2 action:", ["A", "B"], key="p1_period2")
-                    else:
-                        choice2 = st.radio("Choose your Period 2 action:", ["X", "Y", "Z"], key="p2_period2")
-
-                    if st.button("Submit Period 2 Choice"):
-                        game_ref2.child(role).set({
-                            "action": choice2,
-                            "timestamp": time.time()
-                        })
-                        st.success("✅ Your Period 2 choice has been submitted!")
-                        time.sleep(1)
-                        st.rerun()
-
-
-# SHOW GAME SUMMARY ONLY AFTER PERIOD 2 COMPLETION
-if st.session_state.get("show_immediate_results", False):
-    
-    # Enhanced chart function with improved styling
-    def plot_enhanced_percentage_bar(choices, labels, title, player_type):
-        if len(choices) > 0:
-            counts = pd.Series(choices).value_counts(normalize=True).reindex(labels, fill_value=0) * 100
-            
-            # Create figure with enhanced styling
-            fig, ax = plt.subplots(figsize=(10, 6))
-            fig.patch.set_facecolor('#f0f0f0')
-            ax.set_facecolor('#e0e0e0')
-            
-            # Color scheme based on player type
-            colors_p1 = ['#1f77b4', '#ff7f0e'] if player_type == "P1" else ['#1f77b4', '#ff7f0e', '#2ca02c']
-            
-            # Create bar plot with enhanced styling
-            bars = counts.plot(kind='bar', ax=ax, color=colors_p1, linewidth=2, width=0.7)
+        else:
+            st.markdown("✅ Game Complete! Thanks for playing.")
+            my_payoffs = [payoff[ROLES.index(role)] for *_, payoff in outcomes]
+            st.metric("💰 Your total payoff", sum(my_payoffs))
             
-            # Enhanced styling
-            ax.set_title(title, fontsize=16, fontweight='bold', pad=20)
-            ax.set_ylabel("Percentage (%)", fontsize=14)
-            ax.set_xlabel("Choice", fontsize=14)
-            ax.tick_params(rotation=0, labelsize=12)
-            ax.set_ylim(0, max(100, counts.max() * 1.1))
+            # Keep this player's results for the summary below
+            st.session_state["game_complete"] = True
+            st.session_state["match_id"] = match_id
+            st.session_state["outcomes"] = outcomes
             
-            # Add grid for better readability
-            ax.grid(True, alpha=0.3, linestyle='-', linewidth=0.5)
+            # Check if all players finished
+            expected_players = cached_get("expected_players") or 0
+            completed_check = get_stats().get("completed_players", 0)
             
-            # Add value labels on bars
-            for i, bar in enumerate(ax.patches):
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., height + 1,
-                       f'{height:.1f}%', ha='center', va='bottom', fontsize=12, fontweight='bold')
+            if expected_players > 0 and completed_check >= expected_players:
+                st.success("🎉 All players have finished! Results are now available below.")
+                st.info("📊 Scroll down to see the complete game results and charts.")
+                st.session_state["all_games_complete"] = True
             
-            # Add sample size info
-            ax.text(0.02, 0.98, f"Sample size: {len(choices)} participants", 
-                   transform=ax.transAxes, fontsize=10, verticalalignment='top', alpha=0.7,
-                   bbox=dict(boxstyle='round,pad=0.3', facecolor='white', alpha=0.8))
+            # 🎈 BALLOONS CELEBRATION after showing results! 🎈
+            if not st.session_state.get("balloons_shown", False):
+                st.balloons()
+                st.session_state["balloons_shown"] = True
             
-            # Add current date
+            # Show immediate game summary for this player
+            st.session_state["show_immediate_results"] = True
+
+        if uncounted and not waiting_for_partner:
+            # Not waiting for the partner, but a submission still needs counting
+            wait_for_change(("recount", match_id), recount_ready)
+
+
+# SHOW GAME SUMMARY ONLY AFTER THE LAST PERIOD IS COMPLETE
+if st.session_state.get("show_immediate_results", False):
+    
+    # Enhanced chart function with improved styling - cached PNGs or Vega-Lite (see CHART_MODE)
+    def plot_enhanced_percentage_bar(choice_count, labels, title, player_type):
+        if sum(choice_count.values()) > 0:
             today = datetime.today().strftime('%B %d, %Y')
-            ax.text(0.98, 0.98, f"Generated: {today}", transform=ax.transAxes, 
-                   fontsize=10, verticalalignment='top', horizontalalignment='right', alpha=0.7)
-            
-            plt.tight_layout()
-            st.pyplot(fig)
+            show_percentage_chart(choice_count, labels, title, "summary", generated=today)
         else:
             st.warning(f"⚠ No data available for {title}")
 
     st.header("📊 Game Summary - Your Results!")
 
     # Get current game data
-    all_games = db.reference("games").get() or {}
-    expected_players = db.reference("expected_players").get() or 0
+    stats = get_stats()
+    expected_players = cached_get("expected_players") or 0
     
     # Count completed players for status
-    completed_players = 0
-    for match_id, game_data in all_games.items():
-        if "period1" in game_data and "period2" in game_data:
-            if "Player 1" in game_data["period1"] and "Player 2" in game_data["period1"] \
-            and "Player 1" in game_data["period2"] and "Player 2" in game_data["period2"]:
-                completed_players += 2
+    completed_players = stats.get("completed_players", 0)
 
     if expected_players > 0 and completed_players >= expected_players:
-        st.success(f"✅ All {expected_players} players completed both rounds. Final results:")
+        st.success(f"✅ All {expected_players} players completed all {game.periods} rounds. Final results:")
     else:
         st.success("✅ Your game is complete! Here are the current results:")
 
-    p1_choices_r1, p2_choices_r1 = [], []
-    p1_choices_r2, p2_choices_r2 = [], []
-
-    for match in all_games.values():
-        # Round 1
-        if "period1" in match:
-            p1 = match["period1"].get("Player 1", {}).get("action")
-            p2 = match["period1"].get("Player 2", {}).get("action")
-            if p1: p1_choices_r1.append(p1)
-            if p2: p2_choices_r1.append(p2)
-        # Round 2
-        if "period2" in match:
-            p1 = match["period2"].get("Player 1", {}).get("action")
-            p2 = match["period2"].get("Player 2", {}).get("action")
-            if p1: p1_choices_r2.append(p1)
-            if p2: p2_choices_r2.append(p2)
-
-    st.subheader("🎯 Period 1 Results")
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        plot_enhanced_percentage_bar(p1_choices_r1, ["A", "B"], "Player 1 Choices (Period 1)", "P1")
-    with col2:
-        plot_enhanced_percentage_bar(p2_choices_r1, ["X", "Y", "Z"], "Player 2 Choices (Period 1)", "P2")
-
-    st.subheader("🔄 Period 2 Results")
-    col3, col4 = st.columns(2)
-    
-    with col3:
-        plot_enhanced_percentage_bar(p1_choices_r2, ["A", "B"], "Player 1 Choices (Period 2)", "P1")
-    with col4:
-        plot_enhanced_percentage_bar(p2_choices_r2, ["X", "Y", "Z"], "Player 2 Choices (Period 2)", "P2")
+    for index, period in enumerate(game.period_names):
+        st.subheader(f"{'🎯' if index == 0 else '🔄'} {period_label(period)} Results")
+        columns = st.columns(len(ROLES))
+        for column, role in zip(columns, ROLES):
+            with column:
+                plot_enhanced_percentage_bar(
+                    choice_counts(stats, period, role, game.actions[role]), game.actions[role],
+                    f"{role} Choices ({period_label(period)})", f"P{ROLES.index(role) + 1}"
+                )
 
     st.markdown("---")
-    st.markdown("🎮 **Thank you for participating in the 2-Period Dynamic Game!**")
+    st.markdown(f"🎮 **Thank you for participating in the {game.periods}-Period Dynamic Game!**")
@@ -0,0 +1,105 @@
+import random
+
+from events import ACTIVITY_CATEGORIES, EventFeed, PlayerActivity
+from game_logic import ROLES, create_match, record_submission, register_player
+
+
+def activity_of(store):
+    activity = PlayerActivity()
+    activity.apply(EventFeed(store).poll())
+    return activity
+
+
+def test_categories_follow_the_event_log(store):
+    for name in ("a", "b", "c"):
+        register_player(store, name)
+    create_match(store, ["a", "b"])
+    record_submission(store, "a_vs_b", "period1", "Player 1", "A", "a")
+    activity = activity_of(store)
+    assert activity.players["a"]["category"] == "waiting"
+    assert activity.players["b"]["category"] == "playing"
+    assert activity.players["c"]["category"] == "unmatched"
+    counts = activity.summary(now=0)
+    assert {key: counts[key] for key in ("unmatched", "playing", "waiting", "completed")} == \
+        {"unmatched": 1, "playing": 1, "waiting": 1, "completed": 0}
+
+
+def test_applying_events_twice_changes_nothing(store):
+    create_match(store, ["a", "b"])
+    record_submission(store, "a_vs_b", "period1", "Player 1", "A", "a")
+    events = EventFeed(store).poll()
+    activity = PlayerActivity()
+    activity.apply(events)
+    before = {name: dict(player) for name, player in activity.players.items()}
+    activity.apply(events)
+    assert activity.players == before
+
+
+def test_page_filters_and_pages_by_name(store):
+    for index in range(4):
+        create_match(store, [f"p{index}a", f"p{index}b"])
+    activity = activity_of(store)
+    total, rows = activity.page("playing", offset=2, limit=3)
+    assert total == 8
+    assert [row["player"] for row in rows] == ["p1a", "p1b", "p2a"]
+
+
+def match_event(timestamp):
+    return ("m", {"type": "match", "match_id": "a_vs_b", "players": ["a", "b"], "timestamp": timestamp})
+
+
+def submission_event(key, player, role, action, timestamp):
+    return (key, {"type": "submission", "match_id": "a_vs_b", "period": "period1", "role": role,
+                  "action": action, "player": player, "timestamp": timestamp})
+
+
+def test_submitting_restarts_the_stuck_clock():
+    activity = PlayerActivity()
+    activity.apply([match_event(0),
+                    submission_event("s1", "a", "Player 1", "A", 200),
+                    submission_event("s2", "b", "Player 2", "X", 300)])
+    # b finished period 1 second and is still "playing" (now in period 2), but only since 300
+    assert activity.players["b"]["category"] == "playing"
+    assert activity.page("stuck", now=310) == (0, [])
+    total, rows = activity.page("stuck", now=300 + 121)
+    assert total == 2 and [row["player"] for row in rows] == ["a", "b"]
+
+
+def test_partner_who_has_not_submitted_stays_stuck():
+    activity = PlayerActivity()
+    activity.apply([match_event(0), submission_event("s1", "a", "Player 1", "A", 200)])
+    total, rows = activity.page("stuck", now=210)
+    assert total == 1 and rows[0]["player"] == "b"
+
+
+def test_indexes_agree_with_a_full_scan():
+    rng = random.Random(7)
+    events, matches, clock = [], [], 0
+    for index in range(40):
+        clock += rng.uniform(0, 30)
+        pair = [f"p{2 * index:02d}", f"p{2 * index + 1:02d}"]
+        events.append((f"m{index}", {"type": "match", "match_id": "_vs_".join(pair), "players": pair,
+                                     "timestamp": clock}))
+        matches.append(pair)
+    for _ in range(120):
+        clock += rng.uniform(0, 30)
+        pair = rng.choice(matches)
+        role = rng.randrange(2)
+        period = rng.choice(["period1", "period2"])
+        events.append((f"s{clock}", {"type": "submission", "match_id": "_vs_".join(pair), "period": period,
+                                     "role": ROLES[role], "action": "A", "player": pair[role],
+                                     "timestamp": clock}))
+    activity = PlayerActivity()
+    activity.apply(events)
+    now = clock + 60
+    for category in [None, "stuck", *ACTIVITY_CATEGORIES]:
+        if category == "stuck":
+            expected = [name for name in activity.players if activity.stuck(name, now)]
+        else:
+            expected = [name for name, player in activity.players.items()
+                        if category in (None, player["category"])]
+        total, rows = activity.page(category, limit=len(activity.players), now=now)
+        assert (total, [row["player"] for row in rows]) == (len(expected), sorted(expected))
+    summary = activity.summary(now=now)
+    assert summary["stuck"] == sum(activity.stuck(name, now) for name in activity.players)
+    assert sum(summary[category] for category in ACTIVITY_CATEGORIES) == len(activity.players)
@@ -0,0 +1,51 @@
+import math
+
+import pytest
+
+import game_logic
+from analytics import games_frame, payoff_summary
+
+
+def submission(action):
+    return {"action": action, "timestamp": 1.0}
+
+
+def payoffs(frame):
+    return {(row.match_id, row.period, row.role): row.payoff for row in frame.itertuples()}
+
+
+@pytest.mark.parametrize("games", [
+    {"c_vs_d": {"period1": {"Player 1": submission("A")}}},
+    {"c_vs_d": {"period1": {"Player 2": submission("Y")}}},
+    {"c_vs_d": {"period1": {"Player 1": submission("A")}},
+     "e_vs_f": {"period1": {"Player 2": submission("Z")}}},
+])
+def test_partial_periods_have_no_payoff(games):
+    frame = games_frame(games)
+    assert len(frame) == len(games)
+    assert frame["payoff"].isna().all()
+
+
+def test_computed_payoffs_next_to_a_partial_period():
+    games = {
+        "a_vs_b": {"period1": {"Player 1": submission("A"), "Player 2": submission("X")}},
+        "c_vs_d": {"period1": {"Player 1": submission("B")}},
+    }
+    found = payoffs(games_frame(games))
+    assert (found[("a_vs_b", "period1", "Player 1")], found[("a_vs_b", "period1", "Player 2")]) == (4, 3)
+    assert math.isnan(found[("c_vs_d", "period1", "Player 1")])
+
+
+@pytest.mark.parametrize("partial_role", game_logic.ROLES)
+def test_stored_results_next_to_a_partial_period(store, partial_role):
+    game_logic.create_match(store, ["a", "b"])
+    game_logic.create_match(store, ["c", "d"])
+    for role, action, name in zip(game_logic.ROLES, ["B", "Y"], ["a", "b"]):
+        game_logic.record_submission(store, "a_vs_b", "period1", role, action, name)
+    partial_action = {"Player 1": "A", "Player 2": "X"}[partial_role]
+    game_logic.record_submission(store, "c_vs_d", "period1", partial_role, partial_action, "c")
+    frame = games_frame(store.get("games"))
+    found = payoffs(frame)
+    assert (found[("a_vs_b", "period1", "Player 1")], found[("a_vs_b", "period1", "Player 2")]) == (2, 1)
+    assert math.isnan(found[("c_vs_d", "period1", partial_role)])
+    assert payoff_summary(frame)["count"].sum() == 2
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+import game_logic
+import sessions
+from storage import SQLiteStorage
+
+streamlit = pytest.importorskip("streamlit")
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+
+@pytest.fixture
+def app_store(tmp_path, monkeypatch):
+    # The active session of a SQLite file the app under test is pointed at
+    path = str(tmp_path / "app.sqlite3")
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("SQLITE_PATH", path)
+    streamlit.cache_resource.clear()
+    root = SQLiteStorage(path)
+    store = sessions.session_store(root, sessions.ensure_active_session(root))
+    store.set("expected_players", 2)
+    yield store
+    streamlit.cache_resource.clear()
+
+
+def player_page(name):
+    app = AppTest.from_file(APP, default_timeout=60)
+    app.run()
+    app.text_input[-1].input(name)
+    app.run()
+    assert not app.exception, [error.value for error in app.exception]
+    return app
+
+
+def test_matchmaking_wait_keeps_its_backoff_until_the_match_moves(app_store):
+    waiting = player_page("a")
+    state = waiting.session_state["live_wait"]
+    assert state["key"] == ("match", "a")
+    backoff = state["backoff"]
+    backoff.idle()
+    backoff.idle()
+    delay = backoff.delay
+    waiting.run()
+    assert waiting.session_state["live_wait"]["backoff"] is backoff
+    assert backoff.delay == delay
+
+    player_page("b")  # pairs with a: player_match/a moves
+    waiting.run()
+    assert any("You are Player 1" in message.value for message in waiting.success)
+
+
+def test_admin_backoff_starts_over_when_a_watched_version_moves(app_store):
+    admin = AppTest.from_file(APP, default_timeout=60)
+    admin.run()
+    next(field for field in admin.text_input if "Admin Password" in field.label).input("admin123")
+    admin.run()
+    assert not admin.exception, [error.value for error in admin.exception]
+    backoff = admin.session_state["live_wait"]["backoff"]
+    backoff.delay = backoff.start * 4  # grown by idle checks
+    admin.run()
+    assert backoff.delay == backoff.start * 4
+
+    player_page("c")  # registering moves stats/
+    admin.run()
+    assert admin.session_state["live_wait"]["backoff"] is backoff
+    assert backoff.delay == backoff.start
+
+
+def fail_next_batch(store, monkeypatch):
+    commit_batch = store.inner.commit_batch
+
+    def fail_once(label, updates):
+        monkeypatch.setattr(store.inner, "commit_batch", commit_batch)
+        raise ConnectionError("connection dropped")
+
+    monkeypatch.setattr(store.inner, "commit_batch", fail_once)
+
+
+def test_waiting_page_recounts_a_submission_whose_batch_failed(app_store, monkeypatch):
+    game_logic.create_match(app_store, ["a", "b"])
+    fail_next_batch(app_store, monkeypatch)
+    with pytest.raises(ConnectionError):
+        game_logic.record_submission(app_store, "a_vs_b", "period1", "Player 1", "A", "a")
+
+    page = player_page("a")
+    assert any("You already submitted: A" in message.value for message in page.info)
+    assert app_store.get("stats/period1") is None  # the failed attempt may still be in flight
+
+    monkeypatch.setattr(game_logic, "RECOUNT_AFTER", 0)
+    page.run()
+    assert not page.exception
+    assert app_store.get("games/a_vs_b/period1/Player 1/counted") is True
+    assert app_store.get("stats/period1/Player 1") == {"A": 1}
+    assert app_store.get("players/a/progress") == "period1"
+    assert [event["player"] for event in app_store.get("events").values() if event["type"] == "submission"] == ["a"]
+
+
+def test_next_period_page_recounts_the_submission_that_finished_a_period(app_store, monkeypatch):
+    game_logic.create_match(app_store, ["a", "b"])
+    game_logic.record_submission(app_store, "a_vs_b", "period1", "Player 1", "A", "a")
+    fail_next_batch(app_store, monkeypatch)
+    with pytest.raises(ConnectionError):
+        game_logic.record_submission(app_store, "a_vs_b", "period1", "Player 2", "X", "b")
+
+    monkeypatch.setattr(game_logic, "RECOUNT_AFTER", 0)
+    page = player_page("b")
+    assert any("Make Your Choice" in header.value for header in page.subheader)
+    assert app_store.get("stats/joint/period1/A/X") == 1
+    assert app_store.get("ledger/b/total") == 3
+    assert app_store.get("ledger/a/total") == 4
@@ -0,0 +1,33 @@
+import io
+import json
+
+import pytest
+
+import export
+import game_logic
+
+
+@pytest.fixture
+def played(store):
+    game_logic.create_match(store, ["a", "b"])
+    for role, action, name in zip(game_logic.ROLES, ["A", "X"], ["a", "b"]):
+        game_logic.record_submission(store, "a_vs_b", "period1", role, action, name)
+    return store
+
+
+def test_jsonl_rows(played):
+    out = io.BytesIO()
+    assert export.export_games(played, "jsonl", out) == 2
+    rows = [json.loads(line) for line in out.getvalue().decode().splitlines()]
+    assert [(row["player_1"], row["player_2"], row["role"], row["payoff"]) for row in rows] == \
+        [("a", "b", "Player 1", 4), ("a", "b", "Player 2", 3)]
+
+
+def test_parquet_export(played):
+    if "parquet" not in export.EXPORT_FORMATS:
+        pytest.skip("pyarrow is not installed")
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    out = io.BytesIO()
+    assert export.export_games(played, "parquet", out) == 2
+    out.seek(0)
+    assert pyarrow_parquet.read_table(out).num_rows == 2
@@ -0,0 +1,31 @@
+import pytest
+
+from game_logic import DEFAULT_GAME, GameDefinition
+
+PAYOFFS = [[[1, 1], [0, 0]], [[0, 0], [1, 1]]]
+
+
+def definition(labels1, labels2):
+    return GameDefinition({"Player 1": labels1, "Player 2": labels2}, PAYOFFS)
+
+
+def test_round_trip():
+    game = GameDefinition.from_dict(DEFAULT_GAME.to_dict())
+    assert game.key == DEFAULT_GAME.key
+    assert game.payoff("A", "Z") == (1, 4)
+
+
+@pytest.mark.parametrize("labels", [
+    ["", "B"], [" ", "B"], ["A", "A"], ["A/B", "C"], ["A.1", "B"], ["$A", "B"], ["A#", "B"],
+    ["[A]", "B"], ["A\n", "B"], ["0", "1"],
+])
+def test_unsafe_action_labels_are_rejected(labels):
+    with pytest.raises(ValueError):
+        definition(labels, ["X", "Y"])
+    with pytest.raises(ValueError):
+        definition(["X", "Y"], labels)
+
+
+def test_labels_with_spaces_and_digits_are_fine():
+    game = definition(["Go left", "Plan 2"], ["Stay", "Switch"])
+    assert game.payoff("Plan 2", "Switch") == (1, 1)
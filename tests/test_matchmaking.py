@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+import game_logic
+
+
+def play_queue(store, names):
+    # Every name polls join_queue until matched, like a waiting player's reruns
+    results = {}
+
+    def join(name):
+        match_id, role = game_logic.join_queue(store, name)
+        while match_id is None:
+            match_id, role = game_logic.lookup_player_match(store, name)
+            if match_id is None:
+                match_id, role = game_logic.join_queue(store, name)
+        results[name] = (match_id, role)
+
+    threads = [threading.Thread(target=join, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    return results
+
+
+def test_pairs_in_arrival_order(store):
+    assert game_logic.join_queue(store, "a") == (None, None)
+    match_id, role = game_logic.join_queue(store, "b")
+    assert (match_id, role) == ("a_vs_b", "Player 2")
+    assert game_logic.lookup_player_match(store, "a") == ("a_vs_b", "Player 1")
+    assert store.get("matches/a_vs_b/players") == ["a", "b"]
+
+
+def test_everyone_matched_exactly_once_under_threads(store):
+    names = [f"player{index:02d}" for index in range(20)]
+    results = play_queue(store, names)
+    assert sorted(results) == names
+    matches = store.get("matches") or {}
+    assert len(matches) == len(names) // 2
+    seats = Counter(name for match in matches.values() for name in match["players"])
+    assert set(seats.values()) == {1}
+    for name, (match_id, role) in results.items():
+        players = matches[match_id]["players"]
+        assert players[game_logic.ROLES.index(role)] == name
+    assert store.get("stats/matches") == len(names) // 2
+
+
+def test_stale_claims_are_dropped(store, monkeypatch):
+    game_logic.join_queue(store, "a")
+    game_logic.join_queue(store, "b")
+    assert set(store.get("waiting_queue/claimed")) == {"a", "b"}
+    # a finds the match through player_match/ and never picks the claim up
+    assert game_logic.join_queue(store, "a") == ("a_vs_b", "Player 1")
+    later = time.time() + game_logic.CLAIM_TTL + 1
+    monkeypatch.setattr(game_logic.time, "time", lambda: later)
+    game_logic.join_queue(store, "c")
+    assert not store.get("waiting_queue/claimed")
+    assert store.get("waiting_queue/waiting") == {"c": later}
+
+
+def test_polling_keeps_the_join_timestamp(store):
+    game_logic.join_queue(store, "a")
+    joined = store.get("waiting_queue/waiting/a")
+    assert game_logic.join_queue(store, "a") == (None, None)
+    assert store.get("waiting_queue/waiting/a") == joined
+
+
+def fail_create_match_once(monkeypatch):
+    create_match = game_logic.create_match
+
+    def fail_once(store, pair):
+        monkeypatch.setattr(game_logic, "create_match", create_match)
+        raise ConnectionError("connection dropped")
+
+    monkeypatch.setattr(game_logic, "create_match", fail_once)
+
+
+def test_creator_retries_a_failed_match_creation(store, monkeypatch):
+    game_logic.join_queue(store, "a")
+    fail_create_match_once(monkeypatch)
+    with pytest.raises(ConnectionError):
+        game_logic.join_queue(store, "b")
+    # a is claimed, not queued again, while the match is missing
+    assert game_logic.join_queue(store, "a") == (None, None)
+    assert not store.get("waiting_queue/waiting")
+    assert game_logic.join_queue(store, "b") == ("a_vs_b", "Player 2")
+    assert game_logic.join_queue(store, "a") == ("a_vs_b", "Player 1")
+    assert store.get("stats/matches") == 1
+
+
+def test_partner_creates_the_match_when_the_creator_is_gone(store, monkeypatch):
+    game_logic.join_queue(store, "a")
+    fail_create_match_once(monkeypatch)
+    with pytest.raises(ConnectionError):
+        game_logic.join_queue(store, "b")
+    assert game_logic.join_queue(store, "a") == (None, None)
+    later = time.time() + game_logic.CREATE_GRACE
+    monkeypatch.setattr(game_logic.time, "time", lambda: later)
+    assert game_logic.join_queue(store, "a") == ("a_vs_b", "Player 1")
+    assert game_logic.lookup_player_match(store, "b") == ("a_vs_b", "Player 2")
+    assert store.get("matches/a_vs_b/players") == ["a", "b"]
+    assert store.get("stats/matches") == 1
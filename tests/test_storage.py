@@ -0,0 +1,67 @@
+def test_set_get_nested_paths(store):
+    store.set("players/alice", {"timestamp": 1, "progress": "period1"})
+    assert store.get("players/alice/progress") == "period1"
+    assert store.get("/players/alice/") == {"timestamp": 1, "progress": "period1"}
+    assert store.get("players/bob") is None
+
+
+def test_set_none_and_delete_remove_nodes(store):
+    store.set("players/alice", {"timestamp": 1})
+    store.set("players/bob", {"timestamp": 2})
+    store.set("players/alice/timestamp", None)
+    assert store.get("players") == {"bob": {"timestamp": 2}}
+    store.delete("players/bob")
+    assert store.get("players") is None
+
+
+def test_multi_path_update_and_increment(store):
+    store.set("stats/matches", 2)
+    store.update("/", {
+        "matches/m1/players": ["a", "b"],
+        "stats/matches": {".sv": {"increment": 1}},
+        "stats/joint/period1/A/X": {".sv": {"increment": 1}}
+    })
+    assert store.get("matches/m1/players") == ["a", "b"]
+    assert store.get("stats") == {"matches": 3, "joint": {"period1": {"A": {"X": 1}}}}
+
+
+def test_shallow_get(store):
+    store.set("players", {"alice": {"timestamp": 1}, "bob": {"timestamp": 2}})
+    store.set("expected_players", 4)
+    assert store.get("players", shallow=True) == {"alice": True, "bob": True}
+    assert store.get("", shallow=True)["expected_players"] == 4
+
+
+def test_get_page_in_key_order(store):
+    store.set("events", {key: {"n": index} for index, key in enumerate(["b", "d", "a", "c"])})
+    assert list(store.get_page("events")) == ["a", "b", "c", "d"]
+    assert list(store.get_page("events", start_at="b", limit=2)) == ["b", "c"]
+    assert list(store.get_page("events", end_at="b")) == ["a", "b"]
+    assert store.get_page("missing") == {}
+
+
+def test_transaction_sees_current_value(store):
+    store.set("counter", 1)
+    assert store.transaction("counter", lambda current: (current or 0) + 1) == 2
+    assert store.transaction("fresh", lambda current: (current or 0) + 1) == 1
+    assert store.get("counter") == 2
+
+
+def test_listeners_get_initial_value_and_changes_below_path(store):
+    store.set("player_match/alice", "m1")
+    events = []
+    registration = store.listen("player_match", lambda event: events.append((event.path, event.data)))
+    store.set("player_match/bob", "m2")
+    store.set("stats/matches", 1)  # outside the listened path
+    store.delete("player_match")   # an ancestor write reaches the listener as "/"
+    registration.close()
+    store.set("player_match/carol", "m3")
+    assert events == [("/", {"alice": "m1"}), ("/bob", "m2"), ("/", None)]
+
+
+def test_write_hooks_see_written_paths(store):
+    written = []
+    store.add_write_hook(written.extend)
+    store.batch("test").set("a/b", 1).increment("c").commit()
+    store.transaction("d", lambda current: 1)
+    assert sorted(written) == ["a/b", "c", "d"]
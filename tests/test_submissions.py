@@ -0,0 +1,86 @@
+import pytest
+
+import game_logic
+
+
+def play_period(store, match_id, period, actions, names=("a", "b")):
+    return [game_logic.record_submission(store, match_id, period, role, action, name)
+            for role, action, name in zip(game_logic.ROLES, actions, names)]
+
+
+def test_second_submission_completes_the_period(store):
+    game_logic.create_match(store, ["a", "b"])
+    first, second = play_period(store, "a_vs_b", "period1", ["A", "X"])
+    assert first is None
+    assert second == {"Player 1": {"action": "A", "payoff": 4}, "Player 2": {"action": "X", "payoff": 3}}
+    assert store.get("games/a_vs_b/result/period1") == second
+    assert store.get("stats/joint/period1/A/X") == 1
+    assert store.get("ledger/a/total") == 4
+    assert store.get("ledger/b/matches/a_vs_b") == 3
+
+
+def test_duplicate_submission_is_counted_once(store):
+    game_logic.create_match(store, ["a", "b"])
+    game_logic.record_submission(store, "a_vs_b", "period1", "Player 1", "A", "a")
+    assert game_logic.record_submission(store, "a_vs_b", "period1", "Player 1", "B", "a") is None
+    assert store.get("games/a_vs_b/period1/Player 1/action") == "A"
+    assert store.get("stats/period1/Player 1") == {"A": 1}
+    events = [event for event in (store.get("events") or {}).values() if event["type"] == "submission"]
+    assert len(events) == 1
+
+
+def test_transitions_and_completion_are_counted(store):
+    game_logic.create_match(store, ["a", "b"])
+    play_period(store, "a_vs_b", "period1", ["A", "X"])
+    play_period(store, "a_vs_b", "period2", ["B", "Y"])
+    assert store.get("stats/transitions/period2/Player 1/A/X/B") == 1
+    assert store.get("stats/transitions/period2/Player 2/A/X/Y") == 1
+    assert store.get("stats/completed_players") == 2
+    assert store.get("ledger/a/total") == 6
+    assert store.get("players/b/progress") == "period2"
+
+
+def test_submission_records_the_player_and_is_marked_counted(store):
+    game_logic.create_match(store, ["a", "b"])
+    game_logic.record_submission(store, "a_vs_b", "period1", "Player 1", "A", "a")
+    stored = store.get("games/a_vs_b/period1/Player 1")
+    assert (stored["player"], stored["counted"]) == ("a", True)
+
+
+def test_ledger_uses_the_names_on_the_submissions(store):
+    game_logic.create_match(store, ["a", "b"])
+    store.delete("matches")
+    play_period(store, "a_vs_b", "period1", ["A", "X"])
+    assert store.get("ledger") == {"a": {"total": 4, "matches": {"a_vs_b": 4}},
+                                   "b": {"total": 3, "matches": {"a_vs_b": 3}}}
+
+
+def test_failed_batch_is_counted_when_submitting_again(store, monkeypatch):
+    game_logic.create_match(store, ["a", "b"])
+    game_logic.record_submission(store, "a_vs_b", "period1", "Player 1", "A", "a")
+    commit_batch = store.commit_batch
+
+    def fail_once(label, updates):
+        monkeypatch.setattr(store, "commit_batch", commit_batch)
+        raise ConnectionError("connection dropped")
+
+    monkeypatch.setattr(store, "commit_batch", fail_once)
+    with pytest.raises(ConnectionError):
+        game_logic.record_submission(store, "a_vs_b", "period1", "Player 2", "X", "b")
+    assert store.get("games/a_vs_b/period1/Player 2/counted") is False
+    assert store.get("stats/joint") is None
+
+    # Too soon: the first attempt might still be committing
+    assert game_logic.record_submission(store, "a_vs_b", "period1", "Player 2", "X", "b") is None
+    assert store.get("stats/joint") is None
+
+    monkeypatch.setattr(game_logic, "RECOUNT_AFTER", 0)
+    result = game_logic.record_submission(store, "a_vs_b", "period1", "Player 2", "Y", "b")
+    assert result["Player 2"] == {"action": "X", "payoff": 3}
+    assert store.get("games/a_vs_b/period1/Player 2/counted") is True
+    assert store.get("stats/period1/Player 2") == {"X": 1}
+    assert store.get("stats/joint/period1/A/X") == 1
+    assert store.get("ledger/b/total") == 3
+    # Counted now: submitting once more changes nothing
+    assert game_logic.record_submission(store, "a_vs_b", "period1", "Player 2", "X", "b") is None
+    assert store.get("ledger/b/total") == 3
@@ -0,0 +1,107 @@
+"""Period-to-period transition analytics on the stats/ counters.
+
+record_submission() (game_logic) keeps these counters current with a fixed number of
+increments per submission, however many players there are:
+
+    stats/joint/{period}/{P1 action}/{P2 action}                     -> finished outcomes
+    stats/payoffs/{period}/{role}                                     -> payoff sum over them
+    stats/transitions/{period}/{role}/{prev P1}/{prev P2}/{action}   -> choices after that outcome
+
+The functions below turn them into NumPy contingency tables whose size depends only on
+the action sets, so the admin view costs the same for 10 or 10,000 players. The
+independence test is Pearson's chi-square; its p-value uses the closed form of the
+chi-square survival function, so SciPy is not needed.
+"""
+import math
+
+import numpy as np
+
+from game_logic import DEFAULT_GAME, ROLES
+
+
+def _count(node, *keys):
+    for key in keys:
+        node = node.get(key) if isinstance(node, dict) else None
+    return node if isinstance(node, (int, float)) else 0
+
+
+def previous_outcomes(game=DEFAULT_GAME):
+    # Row order of the transition tables: every (Player 1, Player 2) action pair
+    return [(action1, action2) for action1 in game.actions[ROLES[0]] for action2 in game.actions[ROLES[1]]]
+
+
+def joint_table(stats, period, game=DEFAULT_GAME):
+    # Finished outcomes of period: rows Player 1 actions, columns Player 2 actions
+    node = (stats.get("joint") or {}).get(period) or {}
+    return np.array([[_count(node, action1, action2) for action2 in game.actions[ROLES[1]]]
+                     for action1 in game.actions[ROLES[0]]], dtype=np.int64)
+
+
+def transition_table(stats, period, role, game=DEFAULT_GAME):
+    # role's choices in period (columns) by the outcome of the period before (rows)
+    node = ((stats.get("transitions") or {}).get(period) or {}).get(role) or {}
+    return np.array([[_count(node, action1, action2, action) for action in game.actions[role]]
+                     for action1, action2 in previous_outcomes(game)], dtype=np.int64)
+
+
+def mean_payoffs(stats, period, game=DEFAULT_GAME):
+    outcomes = int(joint_table(stats, period, game).sum())
+    sums = (stats.get("payoffs") or {}).get(period) or {}
+    return {role: sums.get(role, 0) / outcomes if outcomes else None for role in ROLES}
+
+
+def chi2_sf(statistic, dof):
+    # P(X >= statistic) for X ~ chi-square(dof): the regularized upper incomplete gamma
+    # function Q(dof / 2, statistic / 2), which has a finite series at half-integer shapes
+    y = statistic / 2
+    if dof % 2 == 0:
+        term = total = 1.0
+        for i in range(1, dof // 2):
+            term *= y / i
+            total += term
+        return min(1.0, math.exp(-y) * total)
+    term = math.sqrt(y) / math.gamma(1.5)
+    total = 0.0
+    for i in range(1, (dof + 1) // 2):
+        total += term
+        term *= y / (i + 0.5)
+    return min(1.0, math.erfc(math.sqrt(y)) + math.exp(-y) * total)
+
+
+def independence_test(table):
+    # Pearson chi-square on the rows and columns with any observations; None when fewer
+    # than two of either are left
+    table = np.asarray(table, dtype=float)
+    table = table[table.sum(axis=1) > 0]
+    table = table[:, table.sum(axis=0) > 0]
+    if table.shape[0] < 2 or table.shape[1] < 2:
+        return None
+    total = table.sum()
+    expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / total
+    statistic = float(((table - expected) ** 2 / expected).sum())
+    dof = (table.shape[0] - 1) * (table.shape[1] - 1)
+    return {"chi2": statistic, "dof": dof, "p_value": chi2_sf(statistic, dof), "n": int(total),
+            "min_expected": float(expected.min())}
+
+
+def transition_counters(games, game=DEFAULT_GAME):
+    # The joint / payoffs / transitions counters recomputed from a full games/ snapshot,
+    # for sessions played before they were maintained
+    counters = {"joint": {}, "payoffs": {}, "transitions": {}}
+    for node in (games or {}).values():
+        node = node if isinstance(node, dict) else {}
+        outcomes, _ = game.progress(node)
+        for period, action1, action2, payoffs in outcomes:
+            joint = counters["joint"].setdefault(period, {}).setdefault(action1, {})
+            joint[action2] = joint.get(action2, 0) + 1
+            sums = counters["payoffs"].setdefault(period, {})
+            for role, payoff in zip(ROLES, payoffs):
+                sums[role] = sums.get(role, 0) + payoff
+        # Every submission made after a finished period, as record_submission counts them
+        for (period, action1, action2, _), next_period in zip(outcomes, game.period_names[1:]):
+            for role, submission in (node.get(next_period) or {}).items():
+                if role in ROLES and isinstance(submission, dict):
+                    counts = (counters["transitions"].setdefault(next_period, {}).setdefault(role, {})
+                              .setdefault(action1, {}).setdefault(action2, {}))
+                    counts[submission["action"]] = counts.get(submission["action"], 0) + 1
+    return counters